@@ -0,0 +1,191 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+# The resamples are always split into this many chunks, each with its own seed, so the results
+# for a `random_state` don't depend on the number of workers
+N_RESAMPLE_CHUNKS = 16
+
+
+def _t_statistics(samples, mean_0=0.0):
+    """
+    One-sample t-statistic for each row of `samples`.
+    """
+    n = samples.shape[1]
+    means = samples.mean(axis=1)
+    standard_errors = samples.std(axis=1, ddof=1) / np.sqrt(n)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return means, (means - mean_0) / standard_errors
+
+
+def block_bootstrap_indices(n, n_resamples, block_size, random_state):
+    """
+    Draw circular block bootstrap indices for all resamples at once.
+
+    Parameters
+    ----------
+    n : int
+        Length of the series being resampled
+    n_resamples : int
+        Number of resamples
+    block_size : int
+        Number of consecutive dates in each block. Use 1 for the iid bootstrap
+    random_state : RandomState
+        Random number generator
+
+    Returns
+    -------
+    indices : 2 dimensional Ndarray
+        Index into the series for each resample (rows) and date (columns)
+    """
+    n_blocks = -(-n // block_size)
+    block_starts = random_state.randint(0, n, (n_resamples, n_blocks))
+    indices = block_starts[:, :, None] + np.arange(block_size)
+
+    return indices.reshape(n_resamples, n_blocks * block_size)[:, :n] % n
+
+
+def _resample_statistics(job):
+    method, returns, n_resamples, block_size, seed, batch_size = job
+    random_state = np.random.RandomState(seed)
+    n = len(returns)
+    sample_mean = returns.mean()
+
+    means = np.empty(n_resamples)
+    t_statistics = np.empty(n_resamples)
+    for start in range(0, n_resamples, batch_size):
+        end = min(start + batch_size, n_resamples)
+
+        if method == 'bootstrap':
+            # Bootstrap-t: center the resampled means on the sample mean to get the null distribution
+            samples = returns[block_bootstrap_indices(n, end - start, block_size, random_state)]
+            means[start:end], t_statistics[start:end] = _t_statistics(samples, sample_mean)
+        elif method == 'permutation':
+            # Under the null the returns are symmetric around zero, so their signs are exchangeable
+            signs = random_state.randint(0, 2, (end - start, n)) * 2 - 1
+            means[start:end], t_statistics[start:end] = _t_statistics(signs * returns)
+        else:
+            raise ValueError('Unknown resampling method {}'.format(method))
+
+    return means, t_statistics
+
+
+def _run_resamples(method, returns, n_resamples, block_size, random_state, n_workers, batch_size):
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    chunk_sizes = np.full(N_RESAMPLE_CHUNKS, n_resamples // N_RESAMPLE_CHUNKS)
+    chunk_sizes[:n_resamples % N_RESAMPLE_CHUNKS] += 1
+    seeds = random_state.randint(0, 2 ** 31 - 1, N_RESAMPLE_CHUNKS)
+    jobs = [
+        (method, returns, chunk_size, block_size, seed, batch_size)
+        for chunk_size, seed in zip(chunk_sizes, seeds)]
+
+    if n_workers == 1:
+        results = list(map(_resample_statistics, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(executor.map(_resample_statistics, jobs))
+
+    means, t_statistics = zip(*results)
+
+    return np.concatenate(means), np.concatenate(t_statistics)
+
+
+def bootstrap_alpha(
+        expected_portfolio_returns_by_date,
+        n_resamples=10000,
+        block_size=1,
+        confidence_level=0.95,
+        random_state=None,
+        n_workers=1,
+        batch_size=1000):
+    """
+    Bootstrap test with the null hypothesis being that the expected mean return is zero.
+
+    Uses the bootstrap-t method for the one-sided p-value and the percentile method for
+    the confidence interval of the mean. Use a `block_size` larger than 1 to keep the
+    autocorrelation of the returns in the resamples.
+
+    Parameters
+    ----------
+    expected_portfolio_returns_by_date : Pandas Series
+        Expected portfolio returns for each date
+    n_resamples : int
+        Number of bootstrap resamples
+    block_size : int
+        Number of consecutive dates in each bootstrap block
+    confidence_level : float
+        Confidence level of the interval for the mean return
+    random_state : int or RandomState
+        Seed or random number generator
+    n_workers : int
+        Number of processes to split the resamples over. Runs in this process if 1. The results
+        for a `random_state` are the same for any number of workers
+    batch_size : int
+        Number of resamples to hold in memory at once in each process
+
+    Returns
+    -------
+    t_value
+        T-statistic of the observed returns
+    p_value
+        Corresponding one-sided bootstrap p-value
+    confidence_interval : tuple of float
+        Lower and upper bound of the mean return
+    """
+    returns = np.asarray(expected_portfolio_returns_by_date, dtype=np.float64)
+    _, t_value = _t_statistics(returns[None, :])
+    t_value = t_value[0]
+
+    means, t_statistics = _run_resamples(
+        'bootstrap', returns, n_resamples, block_size, random_state, n_workers, batch_size)
+
+    p_value = (np.sum(t_statistics >= t_value) + 1.0) / (n_resamples + 1.0)
+    alpha = 1.0 - confidence_level
+    confidence_interval = tuple(np.percentile(means, [100 * alpha / 2, 100 * (1 - alpha / 2)]))
+
+    return t_value, p_value, confidence_interval
+
+
+def permutation_alpha(
+        expected_portfolio_returns_by_date,
+        n_resamples=10000,
+        random_state=None,
+        n_workers=1,
+        batch_size=1000):
+    """
+    Sign-flip permutation test with the null hypothesis being that the expected mean return is zero.
+
+    Parameters
+    ----------
+    expected_portfolio_returns_by_date : Pandas Series
+        Expected portfolio returns for each date
+    n_resamples : int
+        Number of random sign flips
+    random_state : int or RandomState
+        Seed or random number generator
+    n_workers : int
+        Number of processes to split the resamples over. Runs in this process if 1. The results
+        for a `random_state` are the same for any number of workers
+    batch_size : int
+        Number of resamples to hold in memory at once in each process
+
+    Returns
+    -------
+    t_value
+        T-statistic of the observed returns
+    p_value
+        Corresponding one-sided permutation p-value
+    """
+    returns = np.asarray(expected_portfolio_returns_by_date, dtype=np.float64)
+    _, t_value = _t_statistics(returns[None, :])
+    t_value = t_value[0]
+
+    _, t_statistics = _run_resamples('permutation', returns, n_resamples, 1, random_state, n_workers, batch_size)
+
+    p_value = (np.sum(t_statistics >= t_value) + 1.0) / (n_resamples + 1.0)
+
+    return t_value, p_value
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+import helper
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start_time = time.time()
+    fn()
+    elapsed_time = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_time, peak_memory / 2 ** 20
+
+
+def write_quandl_zip(zip_path, n_rows, n_tickers=3000, chunksize=1000000, seed=0):
+    """
+    Write a synthetic Quandl WIKI bulk download zip.
+
+    Parameters
+    ----------
+    zip_path : str
+        Path to save the zip to
+    n_rows : int
+        Number of csv rows
+    n_tickers : int
+        Number of tickers
+    chunksize : int
+        Number of rows to generate at a time
+    seed : int
+        Random seed
+    """
+    random_state = np.random.RandomState(seed)
+    tickers = np.array(['T{:04d}'.format(i) for i in range(n_tickers)], dtype=object)
+    n_dates = -(-n_rows // n_tickers)
+    dates = pd.date_range('1990-01-02', periods=n_dates, freq='B').strftime('%Y-%m-%d')
+    dates = np.asarray(dates, dtype=object)
+
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+        with zip_ref.open('WIKI_PRICES.csv', 'w') as csv_file:
+            for start in range(0, n_rows, chunksize):
+                row_ids = np.arange(start, min(start + chunksize, n_rows))
+                prices = random_state.lognormal(3.0, 1.0, len(row_ids)).round(4)
+                chunk = pd.DataFrame({
+                    'ticker': tickers[row_ids // n_dates],
+                    'date': dates[row_ids % n_dates],
+                    'open': prices,
+                    'high': prices,
+                    'low': prices,
+                    'close': prices,
+                    'volume': random_state.randint(1000, 10000000, len(row_ids)),
+                    'adj_close': prices,
+                    'adj_volume': random_state.randint(1000, 10000000, len(row_ids))},
+                    columns=['ticker', 'date', 'open', 'high', 'low', 'close', 'volume', 'adj_close', 'adj_volume'])
+                csv_file.write(chunk.to_csv(header=start == 0, index=False).encode())
+
+
+def _full_load_filter(zip_path, save_path, columns, tickers, start_date, end_date):
+    # The filtering download_quandl_dataset did before streaming
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            zip_ref.extractall(tmp_dir)
+        tmp_df = pd.read_csv(os.path.join(tmp_dir, 'WIKI_PRICES.csv'))
+        tmp_df['date'] = pd.to_datetime(tmp_df['date'])
+        tmp_df = tmp_df[tmp_df['date'].isin(pd.date_range(start_date, end_date))]
+        tmp_df = tmp_df[tmp_df['ticker'].isin(tickers)]
+        tmp_df.to_csv(save_path, columns=columns, index=False)
+
+
+def benchmark_quandl_filter(n_rows=10000000, n_tickers=3000, top_tickers=500, chunksize=1000000):
+    """
+    Time and peak memory of filtering a synthetic Quandl bulk download, before and after streaming.
+
+    Parameters
+    ----------
+    n_rows : int
+        Number of csv rows in the synthetic download
+    n_tickers : int
+        Number of tickers in the synthetic download
+    top_tickers : int
+        Number of tickers to keep
+    chunksize : int
+        Number of rows to read at a time when streaming
+
+    Returns
+    -------
+    results : DataFrame
+        Seconds and peak MiB for each implementation
+    """
+    columns = ['ticker', 'date', 'adj_close', 'adj_volume']
+    tickers = ['T{:04d}'.format(i) for i in range(top_tickers)]
+    dtype = {'ticker': 'category', 'adj_close': np.float32, 'adj_volume': np.float32}
+    results = {}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = os.path.join(tmp_dir, 'bulk.zip')
+        write_quandl_zip(zip_path, n_rows, n_tickers)
+        start_date, end_date = '1995-01-01', '2005-12-31'
+
+        results['full_load'] = _measure(lambda: _full_load_filter(
+            zip_path, os.path.join(tmp_dir, 'full_load.csv'), columns, tickers, start_date, end_date))
+        results['streaming'] = _measure(lambda: helper.ingest_quandl_zip(
+            zip_path, os.path.join(tmp_dir, 'streaming.csv'), columns, tickers, start_date, end_date,
+            chunksize=chunksize, dtype=dtype))
+
+    return pd.DataFrame(results, index=['seconds', 'peak_mib']).T
+
+
+if __name__ == '__main__':
+    print('Filter a 10M row Quandl bulk download:')
+    print(benchmark_quandl_filter())
@@ -1,13 +1,17 @@
+from collections import OrderedDict
+import hashlib
+import json
 import pandas as pd
 import os
-import tempfile
 import zipfile
-import glob
 from tqdm import tqdm
 import math
 import requests
 
 
+QUANDL_API_URL = 'https://www.quandl.com/api/v3/datatables'
+QUANDL_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.quandl_cache')
+
 color_scheme = {
     'index': '#B6B2CF',
     'etf': '#2D3ECF',
@@ -26,7 +30,255 @@ color_scheme = {
     'main_line': 'black'}
 
 
-def download_quandl_dataset(quandl_api_key, database, dataset, save_path, columns, tickers, start_date, end_date):
+def _quandl_csv_member(zip_ref):
+    # Check if the zip file only contains one csv file
+    #   We're assuming that Quandl will always give us the data in a single csv file.
+    #   If it's different, we want to throw an error.
+    csv_members = [name for name in zip_ref.namelist() if name.endswith('.csv')]
+    assert len(csv_members) == 1,\
+        'Bulk download of Quandl Wiki data failed. Wrong number of csv files found. Found {} file(s).'\
+            .format(len(csv_members))
+
+    return csv_members[0]
+
+
+def _filter_quandl_chunk(chunk, ticker_set, start_ns, end_ns):
+    chunk = chunk[chunk['ticker'].isin(ticker_set)]  # Filter unused tickers
+
+    # Compare the dates as int64 nanoseconds against the bounds. Only the dates of the tickers
+    # that are kept are parsed, and no calendar of dates is built to look them up in
+    date_ns = pd.to_datetime(chunk['date']).values.astype('datetime64[ns]').view('int64')
+    return chunk[(date_ns >= start_ns) & (date_ns <= end_ns)]  # Filter unused dates
+
+
+def _write_chunk(chunk, save_path, columns, partition_by, written_paths):
+    if partition_by == 'year':
+        partitions = chunk.groupby(chunk['date'].str[:4])
+    elif partition_by is None:
+        partitions = [(None, chunk)]
+    else:
+        raise ValueError('Unknown partition {}'.format(partition_by))
+
+    for partition, partition_chunk in partitions:
+        path = save_path if partition is None else os.path.join(save_path, '{}.csv'.format(partition))
+        is_new_file = path not in written_paths
+
+        partition_chunk.to_csv(path, mode='w' if is_new_file else 'a', header=is_new_file, columns=columns, index=False)
+        written_paths.add(path)
+
+
+def ingest_quandl_zip(
+        zip_path, save_path, columns, tickers, start_date, end_date, chunksize=1000000, partition_by=None, dtype=None):
+    """
+    Stream the csv in a Quandl bulk download zip to `save_path`.
+    Filter by columns, tickers, and date, one chunk at a time, so the full dataset is never loaded into memory.
+    Only the columns to save are parsed
+    :param zip_path: The path to the downloaded zip
+    :param save_path: The path to save the dataset. The directory to save to if `partition_by` is set
+    :param columns: The columns to save
+    :param tickers: The tickers to save
+    :param start_date: The rows to save that are older than this date
+    :param end_date: The rows to save that are younger than this date
+    :param chunksize: The number of csv rows to read at a time
+    :param partition_by: Set to 'year' to save a csv file for each year
+    :param dtype: Dtype for each column, like {'ticker': 'category', 'adj_close': np.float32}, to reduce memory
+    """
+    usecols = list(OrderedDict.fromkeys(['ticker', 'date'] + list(columns)))
+    ticker_set = set(tickers)
+    start_ns = pd.Timestamp(start_date).value
+    end_ns = pd.Timestamp(end_date).value
+    written_paths = set()
+
+    if partition_by is not None and not os.path.isdir(save_path):
+        os.makedirs(save_path)
+
+    with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+        with zip_ref.open(_quandl_csv_member(zip_ref)) as csv_file:
+            with tqdm(desc='Transforming Data', unit='Row', unit_scale=True) as pbar:
+                for chunk in pd.read_csv(csv_file, chunksize=chunksize, usecols=usecols, dtype=dtype):
+                    pbar.update(len(chunk))
+                    chunk = _filter_quandl_chunk(chunk, ticker_set, start_ns, end_ns)
+                    _write_chunk(chunk, save_path, columns, partition_by, written_paths)
+
+    # Keep the header when nothing matched the filters
+    if partition_by is None and not written_paths:
+        pd.DataFrame(columns=columns).to_csv(save_path, index=False)
+
+
+def _sha256(path, block_size=1024 * 1024):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(block_size), b''):
+            sha256.update(data)
+
+    return sha256.hexdigest()
+
+
+def _download_resumable(url, part_path, cookies=None, block_size=1024 * 1024):
+    """
+    Download `url` to `part_path`, continuing from the bytes already in `part_path`.
+    Raises an IOError if the download stops early. The partial file is kept to resume from
+    :param url: The url to download
+    :param part_path: The path of the partial download
+    :param cookies: Cookies for the request
+    :param block_size: The number of bytes to write at a time
+    """
+    resume_from = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {'Range': 'bytes={}-'.format(resume_from)} if resume_from else {}
+
+    download_request = requests.get(url, stream=True, cookies=cookies, headers=headers)
+    if download_request.status_code == 416:
+        # Range not satisfiable, the partial file already has every byte
+        return
+    download_request.raise_for_status()
+    if download_request.status_code != 206:
+        # The server ignored the range, start again
+        resume_from = 0
+
+    content_length = download_request.headers.get('content-length')
+    total_size = resume_from + int(content_length) if content_length is not None else None
+    with open(part_path, 'ab' if resume_from else 'wb') as f:
+        for data in tqdm(
+                download_request.iter_content(block_size),
+                initial=resume_from // block_size,
+                total=math.ceil(total_size / block_size) if total_size else None,
+                unit='MB',
+                unit_scale=True,
+                desc='Downloading Data'):
+            f.write(data)
+
+    if total_size is not None and os.path.getsize(part_path) != total_size:
+        raise IOError('Incomplete download of {}. Got {} of {} bytes.'.format(url, os.path.getsize(part_path), total_size))
+
+
+def _export_id(export_file):
+    # The link has a new signature on every request, so it can't identify the export
+    export_metadata = {key: value for key, value in export_file.items() if key not in ('link', 'status')}
+
+    return hashlib.sha1(json.dumps(export_metadata, sort_keys=True).encode()).hexdigest()
+
+
+def _write_cache_entry(index_path, export_id, sha256, cached_zip):
+    # The size and modification time tell if the zip changed, without hashing it again
+    zip_stat = os.stat(cached_zip)
+    with open(index_path, 'w') as f:
+        json.dump({
+            'export_id': export_id,
+            'sha256': sha256,
+            'size': zip_stat.st_size,
+            'mtime_ns': zip_stat.st_mtime_ns}, f)
+
+
+def _is_cached(index_path, cache_entry, cached_zip, verify):
+    if not os.path.isfile(cached_zip):
+        return False
+    if not verify:
+        return True
+
+    zip_stat = os.stat(cached_zip)
+    if zip_stat.st_size == cache_entry.get('size') and zip_stat.st_mtime_ns == cache_entry.get('mtime_ns'):
+        return True
+    if _sha256(cached_zip) != cache_entry['sha256']:
+        return False
+
+    # Unchanged, only touched. Save the new modification time, so it isn't hashed again
+    _write_cache_entry(index_path, cache_entry['export_id'], cache_entry['sha256'], cached_zip)
+    return True
+
+
+def _evict_superseded(cache_dir, index_path, superseded_zip, partial_prefix, part_path):
+    """
+    Remove the zip replaced by a new download, and the partial downloads of older exports of the dataset
+    :param cache_dir: The directory of the cache
+    :param index_path: The index of the dataset
+    :param superseded_zip: The path of the zip that was cached before the download
+    :param partial_prefix: The path prefix of the dataset's partial downloads
+    :param part_path: The partial download of the new export
+    """
+    if superseded_zip is not None and os.path.isfile(superseded_zip):
+        # Zips are saved by their checksum, so another dataset could be using the same one
+        superseded_sha256 = os.path.splitext(os.path.basename(superseded_zip))[0]
+        other_index_paths = [
+            os.path.join(cache_dir, name) for name in os.listdir(cache_dir)
+            if name.endswith('.json') and os.path.join(cache_dir, name) != index_path]
+        for other_index_path in other_index_paths:
+            with open(other_index_path) as f:
+                if json.load(f)['sha256'] == superseded_sha256:
+                    break
+        else:
+            os.remove(superseded_zip)
+
+    partial_dir = os.path.dirname(partial_prefix)
+    for name in os.listdir(partial_dir):
+        old_part_path = os.path.join(partial_dir, name)
+        # Export ids all have the same length, so datasets that start with this one's name are skipped
+        if old_part_path != part_path and old_part_path.startswith(partial_prefix) and name.endswith('.part') and \
+                len(old_part_path) == len(part_path):
+            os.remove(old_part_path)
+
+
+def fetch_quandl_bulk_zip(
+        quandl_api_key, database, dataset, cache_dir=QUANDL_CACHE_DIR, refresh=False, verify=True, api_url=QUANDL_API_URL):
+    """
+    Get the bulk download zip of a Quandl dataset from the cache, downloading it if needed.
+    Zips are saved by their sha256 checksum. Interrupted downloads are resumed on the next call. A new
+    download removes the zip it replaces and any partial downloads of older exports
+    :param quandl_api_key: The Quandl API key
+    :param database: The Quandl database to download from
+    :param dataset: The dataset to download
+    :param cache_dir: The directory to cache downloads in
+    :param refresh: Check Quandl for a newer export, instead of using the cached zip without any network access
+    :param verify: Check the checksum of the cached zip before using it, if its size or modification time changed
+    :param api_url: The url of the Quandl datatables API
+    :return: The path to the cached zip
+    """
+    index_path = os.path.join(cache_dir, '{}_{}.json'.format(database, dataset))
+    objects_dir = os.path.join(cache_dir, 'objects')
+    partial_dir = os.path.join(cache_dir, 'partial')
+    for directory in (objects_dir, partial_dir):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    cache_entry = None
+    superseded_zip = None
+    if os.path.isfile(index_path):
+        with open(index_path) as f:
+            cache_entry = json.load(f)
+        cached_zip = os.path.join(objects_dir, '{}.zip'.format(cache_entry['sha256']))
+        superseded_zip = cached_zip
+
+        if not _is_cached(index_path, cache_entry, cached_zip, verify):
+            cache_entry = None
+        elif not refresh:
+            return cached_zip
+
+    scrape_url = '{}/{}/{}?qopts.export=true&api_key={}'.format(api_url, database, dataset, quandl_api_key)
+    scrape_request = requests.get(scrape_url)
+    export_file = scrape_request.json()['datatable_bulk_download']['file']
+    export_id = _export_id(export_file)
+
+    if cache_entry is not None and cache_entry['export_id'] == export_id:
+        return cached_zip
+
+    partial_prefix = os.path.join(partial_dir, '{}_{}_'.format(database, dataset))
+    part_path = '{}{}.part'.format(partial_prefix, export_id)
+    _download_resumable(export_file['link'], part_path, scrape_request.cookies)
+
+    sha256 = _sha256(part_path)
+    cached_zip = os.path.join(objects_dir, '{}.zip'.format(sha256))
+    os.replace(part_path, cached_zip)
+    _write_cache_entry(index_path, export_id, sha256, cached_zip)
+
+    if superseded_zip == cached_zip:
+        superseded_zip = None
+    _evict_superseded(cache_dir, index_path, superseded_zip, partial_prefix, part_path)
+
+    return cached_zip
+
+
+def download_quandl_dataset(
+        quandl_api_key, database, dataset, save_path, columns, tickers, start_date, end_date, dtype=None,
+        cache_dir=QUANDL_CACHE_DIR, refresh=False):
     """
     Download a dataset from Quandl and save it to `save_path`.
     Filter by columns, tickers, and date
@@ -38,54 +290,12 @@ def download_quandl_dataset(quandl_api_key, database, dataset, save_path, column
     :param tickers: The tickers to save
     :param start_date: The rows to save that are older than this date
     :param end_date: The rows to save that are younger than this date
+    :param dtype: Dtype for each column, like {'ticker': 'category', 'adj_close': np.float32}, to reduce memory
+    :param cache_dir: The directory to cache the bulk download in
+    :param refresh: Check Quandl for a newer export of the dataset
     """
-    scrape_url = 'https://www.quandl.com/api/v3/datatables/{}/{}?qopts.export=true&api_key={}'\
-        .format(database, dataset, quandl_api_key)
-    scrape_request = requests.get(scrape_url)
-    bulk_download_url = scrape_request.json()['datatable_bulk_download']['file']['link']
-
-    with tempfile.TemporaryDirectory() as tmp_dir:
-        tmp_wiki_file = tmp_dir + 'tmp.zip'
-
-        bulk_download_request = requests.get(bulk_download_url, stream=True, cookies=scrape_request.cookies)
-        total_size = int(bulk_download_request.headers.get('content-length', 0));
-        block_size = 1024 * 1024
-        with open(tmp_wiki_file, 'wb') as f:
-            for data in tqdm(
-                    bulk_download_request.iter_content(block_size),
-                    total=math.ceil(total_size // block_size),
-                    unit='MB',
-                    unit_scale=True,
-                    desc='Downloading Data'):
-                f.write(data)
-
-        with tqdm(total=5, desc='Transforming Data', unit='Action') as pbar:
-            # Unzip downloaded data
-            zip_ref = zipfile.ZipFile(tmp_wiki_file, 'r')
-            zip_ref.extractall(tmp_dir)
-            zip_ref.close()
-            pbar.update(1)
-
-            # Check if the zip file only contains one csv file
-            #   We're assuming that Quandl will always give us the data in a single csv file.
-            #   If it's different, we want to throw an error.
-            csv_files = glob.glob(os.path.join(tmp_dir, '*.csv'))
-            assert len(csv_files) == 1,\
-                'Bulk download of Quandl Wiki data failed. Wrong number of csv files found. Found {} file(s).'\
-                    .format(len(csv_files))
-            tmp_csv_file = csv_files[0]
-
-            tmp_df = pd.read_csv(tmp_csv_file)
-            pbar.update(1)
-            tmp_df['date'] = pd.to_datetime(tmp_df['date'])
-            pbar.update(1)
-
-            # Remove unused data and save
-            tmp_df = tmp_df[tmp_df['date'].isin(pd.date_range(start_date, end_date))]  # Filter unused dates
-            tmp_df = tmp_df[tmp_df['ticker'].isin(tickers)]  # Filter unused tickers
-            pbar.update(1)
-            tmp_df.to_csv(save_path, columns=columns, index=False)  # Filter unused columns and save
-            pbar.update(1)
+    bulk_zip = fetch_quandl_bulk_zip(quandl_api_key, database, dataset, cache_dir, refresh)
+    ingest_quandl_zip(bulk_zip, save_path, columns, tickers, start_date, end_date, dtype=dtype)
 
 
 def generate_config():
@@ -0,0 +1,154 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from momentum_signals import top_n_mask
+
+
+MomentumUpdate = namedtuple(
+    'MomentumUpdate',
+    ['signal_date', 'long_tickers', 'short_tickers', 'return_date', 'portfolio_return'])
+
+
+class IncrementalMomentum(object):
+    """
+    Append-only version of the momentum pipeline.
+
+    Keeps just enough state to extend `resample_prices` -> `compute_log_returns` -> `shift_returns`
+    -> `get_top_n` -> `portfolio_returns` by one bar at a time, instead of recomputing the whole
+    history when a new trading day arrives.
+
+    A period (month for `freq='M'`) is final once the first bar of the next period arrives. At that
+    point the engine emits the signals for the new period, which only need returns up to the period
+    that just closed, and the portfolio return of the period before it, whose lookahead return is
+    now known. Both are the same as the matching rows of a full recompute.
+    """
+    def __init__(self, tickers, top_n, n_stocks=None, freq='M'):
+        """
+        Parameters
+        ----------
+        tickers : list of str
+            The tickers in the universe, in the order of the close prices passed to `update`
+        top_n : int
+            The number of top and bottom performing stocks to long and short
+        n_stocks : int
+            The number of stocks invested in each period. Defaults to `2 * top_n`
+        freq : str
+            What frequency to sample at, as used by `resample_prices`
+        """
+        self.tickers = pd.Index(tickers)
+        self.top_n = top_n
+        self.n_stocks = 2 * top_n if n_stocks is None else n_stocks
+        self.freq = freq
+
+        self._period = None
+        self._period_close = None
+        self._prev_close = np.full(len(self.tickers), np.nan)
+        self._signals = None
+        self._prev_signals = None
+
+    def _period_label(self, period):
+        return period.end_time.normalize()
+
+    def _select(self, prev_returns):
+        prev_returns = prev_returns[None, :]
+
+        return (
+            np.flatnonzero(top_n_mask(prev_returns, self.top_n, largest=True)[0]),
+            np.flatnonzero(top_n_mask(prev_returns, self.top_n, largest=False)[0]))
+
+    def _start_period(self, period, prev_returns):
+        self._period = period
+        self._period_close = np.full(len(self.tickers), np.nan)
+        self._prev_signals = self._signals
+        self._signals = (self._period_label(period),) + self._select(prev_returns)
+
+    def _close_period(self):
+        """
+        Finalize the current period and start the next one.
+        """
+        period_close = self._period_close
+        log_returns = np.log(period_close) - np.log(self._prev_close)
+        self._prev_close = period_close
+
+        return_date = None
+        portfolio_return = None
+        if self._prev_signals is not None:
+            return_date, long_ids, short_ids = self._prev_signals
+            long_returns = log_returns[long_ids]
+            short_returns = log_returns[short_ids]
+            portfolio_return = (
+                np.sum(long_returns[~np.isnan(long_returns)]) -
+                np.sum(short_returns[~np.isnan(short_returns)])) / self.n_stocks
+
+        self._start_period(self._period + 1, log_returns)
+        signal_date, long_ids, short_ids = self._signals
+
+        return MomentumUpdate(
+            signal_date,
+            self.tickers[long_ids].tolist(),
+            self.tickers[short_ids].tolist(),
+            return_date,
+            portfolio_return)
+
+    def update(self, date, close):
+        """
+        Add the close prices of a new trading day.
+
+        Parameters
+        ----------
+        date : Timestamp
+            The date of the close prices. Must not be before the last date passed in
+        close : Pandas Series or 1 dimensional Ndarray
+            Close price for each ticker. A Series is aligned to `tickers`
+
+        Returns
+        -------
+        updates : list of MomentumUpdate
+            The signals and portfolio return for each period that was closed by this bar. Empty if
+            the bar is in the same period as the last one
+        """
+        if isinstance(close, pd.Series):
+            close = close.reindex(self.tickers).values
+        close = np.asarray(close, dtype=np.float64)
+        assert close.shape == (len(self.tickers),)
+
+        period = pd.Timestamp(date).to_period(self.freq)
+        updates = []
+
+        if self._period is None:
+            self._start_period(period, np.full(len(self.tickers), np.nan))
+        else:
+            assert period >= self._period, 'Bars must be added in date order'
+            # Periods without any bars are resampled to all NaN closes, same as `resample().last()`
+            while self._period < period:
+                updates.append(self._close_period())
+
+        # `resample().last()` keeps the last non-NaN close of each ticker in the period
+        has_close = ~np.isnan(close)
+        self._period_close[has_close] = close[has_close]
+
+        return updates
+
+    def update_many(self, close_prices):
+        """
+        Add the close prices of several trading days.
+
+        Parameters
+        ----------
+        close_prices : DataFrame
+            Close prices for each ticker and date
+
+        Returns
+        -------
+        updates : list of MomentumUpdate
+            The signals and portfolio return for each period that was closed
+        """
+        close_prices = close_prices.reindex(columns=self.tickers)
+        updates = []
+
+        for date, close in zip(close_prices.index, close_prices.values):
+            updates.extend(self.update(date, close))
+
+        return updates
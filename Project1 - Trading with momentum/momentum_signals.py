@@ -0,0 +1,256 @@
+import numpy as np
+import pandas as pd
+
+
+def top_n_mask(values, top_n, largest=True):
+    """
+    Select the top (or bottom) n values of each row of a 2 dimensional array.
+
+    NaNs are never selected. Ties are broken in favour of the earlier column, which
+    matches `Series.nlargest(top_n)` with `keep='first'`.
+
+    Parameters
+    ----------
+    values : 2 dimensional Ndarray
+        Values for each date (rows) and ticker (columns)
+    top_n : int
+        The number of values to select in each row
+    largest : bool
+        Select the largest values if True, otherwise the smallest values
+
+    Returns
+    -------
+    mask : 2 dimensional Ndarray of bool
+        True where the value was selected
+    """
+    values = np.asarray(values, dtype=np.float64)
+    assert values.ndim == 2
+
+    n_columns = values.shape[1]
+    valid = ~np.isnan(values)
+
+    if top_n <= 0 or n_columns == 0:
+        return np.zeros(values.shape, dtype=bool)
+    if top_n >= n_columns:
+        return valid
+
+    # Rank on the negated values so both sides become a "largest" selection
+    ranked = np.where(valid, values if largest else -values, -np.inf)
+
+    # The n-th largest value of each row, found in linear time
+    threshold = np.partition(ranked, n_columns - top_n, axis=1)[:, n_columns - top_n][:, None]
+
+    above = valid & (ranked > threshold)
+    at_threshold = valid & (ranked == threshold)
+
+    # Fill the remaining slots with the left-most values tied at the threshold
+    remaining = top_n - above.sum(axis=1, keepdims=True)
+    tie_order = np.cumsum(at_threshold, axis=1)
+
+    return above | (at_threshold & (tie_order <= remaining))
+
+
+def long_short_masks(prev_returns, top_n, bottom_n=None):
+    """
+    Select the long and short sides of the momentum portfolio in one pass.
+
+    Parameters
+    ----------
+    prev_returns : DataFrame or 2 dimensional Ndarray
+        Previous shifted returns for each ticker and date
+    top_n : int
+        The number of top performing stocks to long
+    bottom_n : int
+        The number of bottom performing stocks to short. Defaults to `top_n`
+
+    Returns
+    -------
+    long_mask : 2 dimensional Ndarray of int8
+        Top stocks for each date marked with a 1
+    short_mask : 2 dimensional Ndarray of int8
+        Bottom stocks for each date marked with a 1
+    """
+    if bottom_n is None:
+        bottom_n = top_n
+
+    values = prev_returns.values if isinstance(prev_returns, pd.DataFrame) else prev_returns
+
+    long_mask = top_n_mask(values, top_n, largest=True).view(np.int8)
+    short_mask = top_n_mask(values, bottom_n, largest=False).view(np.int8)
+
+    return long_mask, short_mask
+
+
+def get_top_n(prev_returns, top_n):
+    """
+    Select the top performing stocks.
+
+    Vectorized drop-in replacement for the `iterrows` implementation in the project notebook.
+
+    Parameters
+    ----------
+    prev_returns : DataFrame
+        Previous shifted returns for each ticker and date
+    top_n : int
+        The number of top performing stocks to get
+
+    Returns
+    -------
+    top_stocks : DataFrame
+        Top stocks for each ticker and date marked with a 1
+    """
+    top_stocks = top_n_mask(prev_returns.values, top_n).astype(np.int64)
+
+    return pd.DataFrame(top_stocks, prev_returns.index, prev_returns.columns)
+
+
+class SparseSelection(object):
+    """
+    Compressed sparse row (CSR) storage of the tickers selected on each date.
+
+    Only the (date, ticker) pairs that are selected are stored. The tickers selected on
+    date `i` are `indices[indptr[i]:indptr[i + 1]]`, as column positions into `columns`.
+    """
+    def __init__(self, indptr, indices, index, columns):
+        assert len(indptr) == len(index) + 1
+
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.index = index
+        self.columns = columns
+
+    @classmethod
+    def from_mask(cls, mask, index=None, columns=None):
+        """
+        Build the selection from a dense date by ticker mask.
+
+        Parameters
+        ----------
+        mask : DataFrame or 2 dimensional Ndarray
+            Selected stocks for each ticker and date marked with a 1
+        index : Pandas Index
+            Dates of the rows. Taken from `mask` if it's a DataFrame
+        columns : Pandas Index
+            Tickers of the columns. Taken from `mask` if it's a DataFrame
+
+        Returns
+        -------
+        selection : SparseSelection
+            The selected tickers for each date
+        """
+        if isinstance(mask, pd.DataFrame):
+            index = mask.index if index is None else index
+            columns = mask.columns if columns is None else columns
+            mask = mask.values
+
+        mask = np.asarray(mask) != 0
+        if index is None:
+            index = pd.RangeIndex(mask.shape[0])
+        if columns is None:
+            columns = pd.RangeIndex(mask.shape[1])
+
+        _, indices = np.nonzero(mask)
+        indptr = np.zeros(mask.shape[0] + 1, dtype=np.int64)
+        np.cumsum(mask.sum(axis=1), out=indptr[1:])
+
+        return cls(indptr, indices, index, columns)
+
+    @classmethod
+    def from_returns(cls, prev_returns, top_n, largest=True):
+        """
+        Select the top (or bottom) n stocks for each date.
+
+        Parameters
+        ----------
+        prev_returns : DataFrame
+            Previous shifted returns for each ticker and date
+        top_n : int
+            The number of stocks to select for each date
+        largest : bool
+            Select the best performing stocks if True, otherwise the worst performing
+
+        Returns
+        -------
+        selection : SparseSelection
+            The selected tickers for each date
+        """
+        mask = top_n_mask(prev_returns.values, top_n, largest)
+
+        return cls.from_mask(mask, prev_returns.index, prev_returns.columns)
+
+    @property
+    def shape(self):
+        return len(self.index), len(self.columns)
+
+    @property
+    def nnz(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return self.indptr.nbytes + self.indices.nbytes
+
+    def row_ids(self):
+        """
+        Get the row position of every stored (date, ticker) pair.
+
+        Returns
+        -------
+        row_ids : 1 dimensional Ndarray
+            Row position for each entry of `indices`
+        """
+        return np.repeat(np.arange(len(self.index)), np.diff(self.indptr))
+
+    def to_dense(self):
+        """
+        Convert the selection back to the dense format used by the project notebook.
+
+        Returns
+        -------
+        selected : DataFrame
+            Selected stocks for each ticker and date marked with a 1
+        """
+        selected = np.zeros(self.shape, dtype=np.int64)
+        selected[self.row_ids(), self.indices] = 1
+
+        return pd.DataFrame(selected, self.index, self.columns)
+
+
+def sparse_portfolio_returns(long_selection, short_selection, lookahead_returns, n_stocks):
+    """
+    Compute the expected portfolio return for each date, assuming equal investment in each long/short stock.
+
+    Only the lookahead returns of the selected stocks are read. This is the same as
+    `portfolio_returns(df_long, df_short, lookahead_returns, n_stocks).T.sum()`.
+
+    Parameters
+    ----------
+    long_selection : SparseSelection or DataFrame
+        Top stocks for each date
+    short_selection : SparseSelection or DataFrame
+        Bottom stocks for each date
+    lookahead_returns : DataFrame
+        Lookahead returns for each ticker and date
+    n_stocks: int
+        The number of stocks chosen for each month
+
+    Returns
+    -------
+    portfolio_returns_by_date : Pandas Series
+        Expected portfolio returns for each date
+    """
+    lookahead_values = lookahead_returns.values
+    n_dates = lookahead_values.shape[0]
+    portfolio_returns_by_date = np.zeros(n_dates)
+
+    for selection, sign in ((long_selection, 1.0), (short_selection, -1.0)):
+        if not isinstance(selection, SparseSelection):
+            selection = SparseSelection.from_mask(selection)
+        assert selection.shape == lookahead_values.shape
+
+        row_ids = selection.row_ids()
+        selected_returns = lookahead_values[row_ids, selection.indices]
+        selected_returns = np.where(np.isnan(selected_returns), 0.0, selected_returns)
+        portfolio_returns_by_date += sign * np.bincount(row_ids, selected_returns, minlength=n_dates)
+
+    return pd.Series(portfolio_returns_by_date / n_stocks, lookahead_returns.index)
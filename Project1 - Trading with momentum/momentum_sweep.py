@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+
+PERIODS_PER_YEAR = {'D': 252, 'B': 252, 'W': 52, 'M': 12, 'BM': 12, 'Q': 4, 'BQ': 4, 'A': 1, 'BA': 1}
+
+
+def _periods_per_year(freq, index):
+    freq_alias = freq.split('-')[0].upper()
+    if freq_alias in PERIODS_PER_YEAR:
+        return PERIODS_PER_YEAR[freq_alias]
+
+    # Estimate from the spacing of the resampled dates
+    return pd.Timedelta(days=365.25) / pd.Series(index).diff().median()
+
+
+def _prefix_sums(values, order):
+    """
+    Sum of the first k values of each row in `order`, for every k.
+    """
+    n_rows, n_columns = values.shape
+    prefix_sums = np.zeros((n_rows, n_columns + 1))
+    np.cumsum(values[np.arange(n_rows)[:, None], order], axis=1, out=prefix_sums[:, 1:])
+
+    return prefix_sums
+
+
+def sweep_top_bottom_n(prev_returns, lookahead_returns, top_bottom_ns):
+    """
+    Compute the expected portfolio returns by date for many values of `top_bottom_n`.
+
+    Each date is sorted once per side. Because the top n stocks are a prefix of the
+    top m stocks for n < m, the return of every n is read off running sums of the sorted
+    lookahead returns. Matches `portfolio_returns(get_top_n(prev_returns, n),
+    get_top_n(-1*prev_returns, n), lookahead_returns, 2*n).T.sum()` for each n. Dates without any
+    lookahead returns are NaN.
+
+    Parameters
+    ----------
+    prev_returns : DataFrame
+        Previous shifted returns for each ticker and date
+    lookahead_returns : DataFrame
+        Lookahead returns for each ticker and date
+    top_bottom_ns : list of int
+        The number of stocks to long and short
+
+    Returns
+    -------
+    portfolio_returns_by_date : DataFrame
+        Expected portfolio returns for each date and `top_bottom_n`
+    """
+    prev_values = prev_returns.values
+    lookahead_missing = np.isnan(lookahead_returns.values)
+    lookahead_values = np.where(lookahead_missing, 0.0, lookahead_returns.values)
+    valid = ~np.isnan(prev_values)
+    n_valid = valid.sum(axis=1)
+
+    # Stable sorts, so ties keep the left-most ticker like `nlargest`. NaNs sort last.
+    long_order = np.argsort(np.where(valid, -prev_values, np.inf), axis=1, kind='mergesort')
+    short_order = np.argsort(np.where(valid, prev_values, np.inf), axis=1, kind='mergesort')
+    long_sums = _prefix_sums(lookahead_values, long_order)
+    short_sums = _prefix_sums(lookahead_values, short_order)
+
+    rows = np.arange(len(prev_values))
+    portfolio_returns_by_date = np.empty((len(prev_values), len(top_bottom_ns)))
+    for i, top_bottom_n in enumerate(top_bottom_ns):
+        n_selected = np.minimum(top_bottom_n, n_valid)
+        long_short_returns = long_sums[rows, n_selected] - short_sums[rows, n_selected]
+
+        # Both sides hold every stock, so they cancel out exactly. Avoid any rounding error from
+        # summing them in a different order.
+        long_short_returns[n_selected == n_valid] = 0.0
+        portfolio_returns_by_date[:, i] = long_short_returns / (2 * top_bottom_n)
+
+    # The sum of the portfolio returns is NaN when every lookahead return is, like the last date.
+    # Keep them NaN, so they're dropped instead of counted as a return of 0.
+    portfolio_returns_by_date[lookahead_missing.all(axis=1)] = np.nan
+
+    return pd.DataFrame(portfolio_returns_by_date, prev_returns.index, list(top_bottom_ns))
+
+
+def summarize_returns(portfolio_returns_by_date, periods_per_year):
+    """
+    Get the statistics used by the project notebook for a portfolio return series.
+
+    Parameters
+    ----------
+    portfolio_returns_by_date : 1 dimensional Ndarray
+        Expected portfolio returns for each date
+    periods_per_year : float
+        Number of rebalance periods in a year
+
+    Returns
+    -------
+    summary : dict
+        Mean, standard error, annualized rate of return (%), t-value and one-sided p-value
+    """
+    portfolio_returns_by_date = np.asarray(portfolio_returns_by_date)
+    portfolio_returns_by_date = portfolio_returns_by_date[~np.isnan(portfolio_returns_by_date)]
+    t_value, p_value = stats.ttest_1samp(portfolio_returns_by_date, 0.0)
+    mean = portfolio_returns_by_date.mean()
+
+    return {
+        'mean': mean,
+        'standard_error': portfolio_returns_by_date.std(ddof=1) / np.sqrt(len(portfolio_returns_by_date)),
+        'annualized_return': (np.exp(mean * periods_per_year) - 1) * 100,
+        't_value': t_value,
+        'p_value': p_value / 2}
+
+
+def _evaluate_shift(job):
+    freq, shift_n, returns, top_bottom_ns, periods_per_year = job
+    prev_returns = returns.shift(shift_n)
+    lookahead_returns = returns.shift(-1)
+    portfolio_returns_by_date = sweep_top_bottom_n(prev_returns, lookahead_returns, top_bottom_ns)
+
+    results = []
+    for top_bottom_n in top_bottom_ns:
+        result = {'freq': freq, 'shift_n': shift_n, 'top_bottom_n': top_bottom_n}
+        result.update(summarize_returns(portfolio_returns_by_date[top_bottom_n].values, periods_per_year))
+        results.append(result)
+
+    return results
+
+
+def sweep_momentum(close_prices, top_bottom_ns, freqs=('M',), shift_ns=(1,), n_workers=None):
+    """
+    Evaluate the momentum strategy for every combination of parameters.
+
+    Prices are resampled and log returns computed once per frequency. Each (frequency, shift)
+    pair is then evaluated for all `top_bottom_ns` at once, with the pairs spread over a
+    process pool.
+
+    Parameters
+    ----------
+    close_prices : DataFrame
+        Close prices for each ticker and date
+    top_bottom_ns : list of int
+        The number of stocks to long and short
+    freqs : list of str
+        The frequencies to resample at
+    shift_ns : list of int
+        The number of periods to shift the returns by to get the previous returns
+    n_workers : int
+        Number of worker processes. Runs in this process if 1. Defaults to the number of CPUs
+
+    Returns
+    -------
+    results : DataFrame
+        Mean, standard error, annualized return, t-value and p-value for each combination
+    """
+    top_bottom_ns = list(top_bottom_ns)
+    jobs = []
+
+    for freq in freqs:
+        prices = close_prices.resample(freq).last()
+        returns = np.log(prices) - np.log(prices.shift(1))
+        periods_per_year = _periods_per_year(freq, prices.index)
+
+        for shift_n in shift_ns:
+            jobs.append((freq, shift_n, returns, top_bottom_ns, periods_per_year))
+
+    if n_workers == 1 or len(jobs) == 1:
+        results = list(itertools.chain.from_iterable(map(_evaluate_shift, jobs)))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            results = list(itertools.chain.from_iterable(executor.map(_evaluate_shift, jobs)))
+
+    return pd.DataFrame(
+        results,
+        columns=['freq', 'shift_n', 'top_bottom_n', 'mean', 'standard_error', 'annualized_return', 't_value', 'p_value'])
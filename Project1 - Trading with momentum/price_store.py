@@ -0,0 +1,270 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+
+STORE_VERSION = 1
+META_FILE = 'meta.json'
+DATES_FILE = 'dates.npy'
+TICKERS_FILE = 'tickers.npy'
+
+
+def _field_file(store_dir, field):
+    return os.path.join(store_dir, '{}.npy'.format(field))
+
+
+def _source_signature(csv_path):
+    stat = os.stat(csv_path)
+    return {'path': os.path.abspath(csv_path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def _factorize_cells(df, index, columns):
+    """
+    Get the row and column position of each row of a long format DataFrame in the wide format.
+    """
+    row_codes, row_labels = pd.factorize(df[index], sort=True)
+    column_codes, column_labels = pd.factorize(df[columns], sort=True)
+    row_labels = pd.Index(row_labels, name=index)
+    column_labels = pd.Index(column_labels, name=columns)
+
+    assert (row_codes >= 0).all() and (column_codes >= 0).all(), 'Missing values in the index or columns'
+
+    cell_counts = np.bincount(
+        row_codes * len(column_labels) + column_codes,
+        minlength=len(row_labels) * len(column_labels))
+    if (cell_counts > 1).any():
+        raise ValueError('Index contains duplicate entries, cannot reshape')
+
+    return row_codes, column_codes, row_labels, column_labels
+
+
+def pivot_fields(df, fields, index='date', columns='ticker'):
+    """
+    Pivot several columns of a long format DataFrame into wide format in one pass.
+
+    Same as calling `df.reset_index().pivot(index=index, columns=columns, values=field)` for
+    each field, but the index and columns are only sorted and factorized once.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Long format data, with one row for each index and column pair
+    fields : list of str
+        The columns of `df` to pivot
+    index : str
+        The column of `df` to use as the index of the wide DataFrames
+    columns : str
+        The column of `df` to use as the columns of the wide DataFrames
+
+    Returns
+    -------
+    field_dfs : dict of DataFrame
+        Wide DataFrame for each field. All DataFrames share the same index objects
+    """
+    row_codes, column_codes, row_labels, column_labels = _factorize_cells(df, index, columns)
+    shape = (len(row_labels), len(column_labels))
+    is_complete = len(df) == shape[0] * shape[1]
+
+    field_dfs = {}
+    for field in fields:
+        values = df[field].values
+        dtype = values.dtype
+        if not is_complete and dtype.kind in 'iub':
+            # Missing cells are filled with NaN, same as pivot
+            dtype = np.float64
+
+        wide_values = np.empty(shape, dtype=dtype)
+        if not is_complete:
+            wide_values.fill(np.nan)
+        wide_values[row_codes, column_codes] = values
+        field_dfs[field] = pd.DataFrame(wide_values, row_labels, column_labels, copy=False)
+
+    return field_dfs
+
+
+def convert_csv(csv_path, store_dir, fields, dtype=np.float64, date_column='date', ticker_column='ticker'):
+    """
+    Convert a long format price csv into a columnar price store.
+
+    Each field is saved as a date by ticker matrix in its own `.npy` file, next to the
+    date and ticker index files. The csv is only parsed once.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path to the long format csv, with one row for each ticker and date
+    store_dir : str
+        Directory to save the price store to
+    fields : list of str
+        The columns of the csv to save
+    dtype : Numpy dtype
+        The dtype of the saved matrices. Use float32 to halve the size on disk
+    date_column : str
+        The column with the dates
+    ticker_column : str
+        The column with the ticker symbols
+    """
+    df = pd.read_csv(csv_path, usecols=[date_column, ticker_column] + list(fields), parse_dates=[date_column])
+    date_codes, ticker_codes, dates, tickers = _factorize_cells(df, date_column, ticker_column)
+    shape = (len(dates), len(tickers))
+
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    # The metadata is written last, so a store that was interrupted while converting is never loaded
+    meta_path = os.path.join(store_dir, META_FILE)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+
+    np.save(os.path.join(store_dir, DATES_FILE), np.asarray(dates, dtype='datetime64[ns]'))
+    np.save(os.path.join(store_dir, TICKERS_FILE), np.asarray(tickers, dtype=str))
+
+    for field in fields:
+        # Scatter straight into the file so the full matrix never has to be held in memory
+        matrix = np.lib.format.open_memmap(_field_file(store_dir, field), mode='w+', dtype=dtype, shape=shape)
+        matrix[:] = np.nan
+        matrix[date_codes, ticker_codes] = df[field].values
+        matrix.flush()
+        del matrix
+
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'fields': list(fields),
+            'dtype': np.dtype(dtype).name,
+            'shape': list(shape),
+            'source': _source_signature(csv_path)}, f)
+
+
+def _read_meta(store_dir):
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_fields(store_dir, fields=None):
+    """
+    Load fields from a price store.
+
+    The matrices are memory-mapped, so loading doesn't read or copy the data. The DataFrames
+    have the same layout as `df.reset_index().pivot(index='date', columns='ticker', values=field)`,
+    with the dates as a DatetimeIndex. They are read-only.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the price store
+    fields : list of str
+        The fields to load. Loads all of them if None
+
+    Returns
+    -------
+    field_dfs : dict of DataFrame
+        Values for each ticker and date, by field. All DataFrames share the same index objects
+    """
+    meta = _read_meta(store_dir)
+    assert meta is not None, 'No price store found in {}'.format(store_dir)
+
+    if fields is None:
+        fields = meta['fields']
+    missing_fields = set(fields) - set(meta['fields'])
+    assert not missing_fields, 'Fields {} not in price store'.format(sorted(missing_fields))
+
+    dates = pd.DatetimeIndex(np.load(os.path.join(store_dir, DATES_FILE)), name='date')
+    tickers = pd.Index(np.load(os.path.join(store_dir, TICKERS_FILE)).astype(object), name='ticker')
+
+    field_dfs = {}
+    for field in fields:
+        matrix = np.load(_field_file(store_dir, field), mmap_mode='r')
+        field_dfs[field] = pd.DataFrame(matrix, dates, tickers, copy=False)
+
+    return field_dfs
+
+
+def load_field(store_dir, field):
+    """
+    Load a single field from a price store.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the price store
+    field : str
+        The field to load
+
+    Returns
+    -------
+    field_df : DataFrame
+        Values for each ticker and date
+    """
+    return load_fields(store_dir, [field])[field]
+
+
+def is_stale(csv_path, store_dir, fields, dtype=None):
+    """
+    Check if a price store needs to be rebuilt from its csv.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path to the long format csv
+    store_dir : str
+        Directory of the price store
+    fields : list of str
+        The fields that need to be in the store
+    dtype : Numpy dtype
+        The dtype the matrices need to have. Any dtype will do if None
+
+    Returns
+    -------
+    stale : bool
+        True if the store is missing, out of date, missing fields or saved with another dtype
+    """
+    meta = _read_meta(store_dir)
+
+    return meta is None or \
+        meta['version'] != STORE_VERSION or \
+        meta['source'] != _source_signature(csv_path) or \
+        not set(fields).issubset(meta['fields']) or \
+        (dtype is not None and meta['dtype'] != np.dtype(dtype).name)
+
+
+def load_csv_fields(csv_path, fields, store_dir=None, dtype=np.float64):
+    """
+    Load fields of a long format price csv, converting it to a price store the first time.
+
+    Parameters
+    ----------
+    csv_path : str
+        Path to the long format csv
+    fields : list of str
+        The fields to load
+    store_dir : str
+        Directory of the price store. Defaults to a directory next to the csv
+    dtype : Numpy dtype
+        The dtype of the saved matrices. The store is rebuilt if it was saved with another dtype
+
+    Returns
+    -------
+    field_dfs : dict of DataFrame
+        Values for each ticker and date, by field
+    """
+    if store_dir is None:
+        store_dir = os.path.splitext(csv_path)[0] + '_store'
+
+    if is_stale(csv_path, store_dir, fields, dtype):
+        # Keep the fields already in the store, if the csv still has them
+        meta = _read_meta(store_dir)
+        store_fields = [] if meta is None else meta['fields']
+        csv_columns = set(pd.read_csv(csv_path, nrows=0).columns)
+        convert_csv(
+            csv_path,
+            store_dir,
+            list(fields) + [field for field in store_fields if field not in fields and field in csv_columns],
+            dtype)
+
+    return load_fields(store_dir, fields)
@@ -1,4 +1,10 @@
 from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import os
+import tempfile
+import threading
+import zipfile
 import pandas as pd
 import numpy as np
 
@@ -178,3 +184,443 @@ def test_analyze_alpha(fn):
             0.208114098207)])
 
     assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_long_short_masks(fn):
+    tickers = generate_random_tickers(5)
+    dates = pd.DatetimeIndex(['2008-08-31', '2008-09-30', '2008-10-31', '2008-11-30'])
+
+    fn_inputs = {
+        'prev_returns': pd.DataFrame(
+            [
+                [np.nan, np.nan, np.nan, np.nan, np.nan],
+                [np.nan, 0.72709204, np.nan, 1.77557845, np.nan],
+                [3.13172138, 0.72709204, 5.76874778, 0.72709204, 0.04098317],
+                [-3.78816218, -0.67583590, -4.95433863, -1.67093250, -0.24929051]],
+            dates, tickers),
+        'top_n': 2}
+    fn_correct_outputs = OrderedDict([
+        (
+            'long_mask',
+            np.array(
+                [
+                    [0, 0, 0, 0, 0],
+                    [0, 1, 0, 1, 0],
+                    [1, 0, 1, 0, 0],
+                    [0, 1, 0, 0, 1]],
+                np.int8)),
+        (
+            'short_mask',
+            np.array(
+                [
+                    [0, 0, 0, 0, 0],
+                    [0, 1, 0, 1, 0],
+                    [0, 1, 0, 0, 1],
+                    [1, 0, 1, 0, 0]],
+                np.int8))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_sparse_portfolio_returns(fn):
+    tickers = generate_random_tickers(5)
+    dates = pd.DatetimeIndex(['2008-08-31', '2008-09-30', '2008-10-31', '2008-11-30'])
+
+    fn_inputs = {
+        'long_selection': pd.DataFrame(
+            [
+                [0, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0],
+                [1, 0, 1, 1, 0],
+                [0, 1, 0, 1, 1]],
+            dates, tickers),
+        'short_selection': pd.DataFrame(
+            [
+                [0, 0, 0, 0, 0],
+                [0, 0, 0, 0, 0],
+                [0, 1, 0, 1, 1],
+                [1, 1, 1, 0, 0]],
+            dates, tickers),
+        'lookahead_returns': pd.DataFrame(
+            [
+                [3.13172138, 0.72709204, 5.76874778, 1.77557845, 0.04098317],
+                [-3.78816218, -0.67583590, -4.95433863, -1.67093250, -0.24929051],
+                [0.05579709, 0.29199789, 0.00697116, 1.05956179, 0.30686995],
+                [1.25459098, np.nan, 2.58265839, 6.92676837, 0.84632677]],
+            dates, tickers),
+        'n_stocks': 3}
+    fn_correct_outputs = OrderedDict([
+        (
+            'portfolio_returns_by_date',
+            pd.Series(
+                [0.00000000, 0.00000000, -0.17869986, 1.31194859],
+                dates))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_load_csv_fields(fn):
+    tickers = sorted(generate_random_tickers(3))
+    dates = pd.DatetimeIndex(['2008-08-29', '2008-09-02', '2008-09-03'], name='date')
+    long_df = pd.DataFrame({
+        'date': ['2008-09-03', '2008-08-29', '2008-09-02', '2008-08-29', '2008-09-03', '2008-09-02', '2008-08-29'],
+        'ticker': [tickers[0], tickers[0], tickers[1], tickers[1], tickers[1], tickers[2], tickers[2]],
+        'adj_close': [21.05081048, 17.01384381, 10.98450376, 11.24809343, 12.96171273, 482.34539247, 35.20258059],
+        'adj_volume': [9.83683e+06, 1.78072e+07, 8.82982e+06, 8.22427e+07, 6.85315e+07, 4.81601e+07, 1.62348e+07]})
+    expected_close = pd.DataFrame(
+        [
+            [17.01384381, 11.24809343, 35.20258059],
+            [np.nan, 10.98450376, 482.34539247],
+            [21.05081048, 12.96171273, np.nan]],
+        dates, pd.Index(tickers, name='ticker'))
+    expected_volume = pd.DataFrame(
+        [
+            [1.78072e+07, 8.22427e+07, 1.62348e+07],
+            [np.nan, 8.82982e+06, 4.81601e+07],
+            [9.83683e+06, 6.85315e+07, np.nan]],
+        dates, pd.Index(tickers, name='ticker'))
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'eod-quotemedia.csv')
+        long_df.to_csv(csv_path, index=False)
+
+        for _ in range(2):
+            field_dfs = fn(csv_path, ['adj_close', 'adj_volume'])
+
+            assert sorted(field_dfs) == ['adj_close', 'adj_volume'], 'Wrong fields loaded'
+            for out_df, expected_df in ((field_dfs['adj_close'], expected_close), (field_dfs['adj_volume'], expected_volume)):
+                assert out_df.index.equals(expected_df.index), 'Wrong dates'
+                assert out_df.columns.equals(expected_df.columns), 'Wrong tickers'
+                assert np.allclose(out_df.values, expected_df.values, equal_nan=True), 'Wrong values'
+            assert field_dfs['adj_close'].index is field_dfs['adj_volume'].index, 'Fields should share the same index'
+
+
+@project_test
+def test_load_csv_fields_rebuild(fn):
+    tickers = sorted(generate_random_tickers(2))
+    long_df = pd.DataFrame({
+        'date': ['2008-08-29', '2008-08-29', '2008-09-02', '2008-09-02'],
+        'ticker': [tickers[0], tickers[1], tickers[0], tickers[1]],
+        'adj_close': [17.01384381, 11.24809343, 17.21384381, 10.98450376],
+        'adj_volume': [1.78072e+07, 8.22427e+07, 1.62348e+07, 8.82982e+06],
+        'dividends': [0.0, 0.0, 0.25, 0.0]})
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_path = os.path.join(tmp_dir, 'eod-quotemedia.csv')
+        meta_path = os.path.join(tmp_dir, 'eod-quotemedia_store', 'meta.json')
+        long_df.to_csv(csv_path, index=False)
+
+        fn(csv_path, ['adj_close', 'adj_volume'])
+        field_dfs = fn(csv_path, ['dividends'])
+        assert np.allclose(field_dfs['dividends'].values, [[0.0, 0.0], [0.25, 0.0]]), 'Wrong values'
+        with open(meta_path) as f:
+            meta = json.load(f)
+        assert sorted(meta['fields']) == ['adj_close', 'adj_volume', 'dividends'], \
+            'A rebuild should keep the fields already in the store. Got {}'.format(meta['fields'])
+
+        # Loading a field that's already in the store shouldn't rebuild it
+        os.remove(os.path.join(tmp_dir, 'eod-quotemedia_store', 'adj_close.npy'))
+        field_dfs = fn(csv_path, ['adj_volume'])
+        assert np.allclose(field_dfs['adj_volume'].values, [[1.78072e+07, 8.22427e+07], [1.62348e+07, 8.82982e+06]]), \
+            'Wrong values'
+        assert not os.path.isfile(os.path.join(tmp_dir, 'eod-quotemedia_store', 'adj_close.npy')), \
+            'The store was rebuilt, but it already had the fields'
+
+        field_dfs = fn(csv_path, ['adj_close'], dtype=np.float32)
+        assert field_dfs['adj_close'].values.dtype == np.float32, \
+            'Wrong dtype. Expected float32, got {}'.format(field_dfs['adj_close'].values.dtype)
+        assert np.allclose(field_dfs['adj_close'].values, [[17.01384381, 11.24809343], [17.21384381, 10.98450376]]), \
+            'Wrong values'
+
+
+@project_test
+def test_incremental_momentum(cls):
+    tickers = generate_random_tickers(5)
+    dates = pd.DatetimeIndex([
+        '2008-08-19', '2008-09-08', '2008-09-28', '2008-10-18', '2008-11-07', '2008-11-27', '2008-12-05'])
+    close_prices = pd.DataFrame(
+        [
+            [21.050810483942833, 17.013843810658827, 10.984503755486879, 11.248093428369392, 12.961712733997235],
+            [15.63570258751384, 14.69054309070934, 11.353027688995159, 475.74195118202061, 11.959640427803022],
+            [482.34539247360806, 35.202580592515041, 3516.5416782257166, 66.405314327318209, 13.503960481087077],
+            [10.918933017418304, 17.9086438675435, 24.801265417692324, 12.488954191854916, 10.52435923388642],
+            [10.675971965144655, 12.749401436636365, 11.805257579935713, 21.539039489843024, 19.99766036804861],
+            [11.545495378369814, 23.981468434099405, 24.974763062186504, 36.031962102997689, 14.304332320024963],
+            [12.0, 12.0, 12.0, 12.0, 12.0]],
+        dates, tickers)
+    expected_updates = [
+        (pd.Timestamp('2008-09-30'), [], [], None, None),
+        (pd.Timestamp('2008-10-31'), [0, 2], [1, 4], pd.Timestamp('2008-08-31'), 0.0),
+        (pd.Timestamp('2008-11-30'), [1, 4], [0, 2], pd.Timestamp('2008-09-30'), 0.0),
+        (pd.Timestamp('2008-12-31'), [3, 4], [0, 2], pd.Timestamp('2008-10-31'), -0.13402490)]
+
+    momentum = cls(tickers, 2)
+    updates = momentum.update_many(close_prices.iloc[:-1])
+    updates += momentum.update(dates[-1], close_prices.iloc[-1])
+
+    assert len(updates) == len(expected_updates), \
+        'Wrong number of updates. Got {}, expected {}'.format(len(updates), len(expected_updates))
+    for update, (signal_date, long_ids, short_ids, return_date, portfolio_return) in zip(updates, expected_updates):
+        assert update.signal_date == signal_date, 'Wrong signal date {}'.format(update.signal_date)
+        assert sorted(update.long_tickers) == sorted(tickers[i] for i in long_ids), \
+            'Wrong long tickers for {}'.format(signal_date)
+        assert sorted(update.short_tickers) == sorted(tickers[i] for i in short_ids), \
+            'Wrong short tickers for {}'.format(signal_date)
+        assert update.return_date == return_date, 'Wrong return date for {}'.format(signal_date)
+        if portfolio_return is None:
+            assert update.portfolio_return is None, 'Unexpected portfolio return for {}'.format(signal_date)
+        else:
+            assert np.isclose(update.portfolio_return, portfolio_return), \
+                'Wrong portfolio return for {}'.format(return_date)
+
+
+@project_test
+def test_sweep_top_bottom_n(fn):
+    tickers = generate_random_tickers(5)
+    dates = pd.DatetimeIndex(['2008-08-31', '2008-09-30', '2008-10-31', '2008-11-30', '2008-12-31'])
+
+    fn_inputs = {
+        'prev_returns': pd.DataFrame(
+            [
+                [np.nan, np.nan, np.nan, np.nan, np.nan],
+                [np.nan, np.nan, np.nan, np.nan, np.nan],
+                [3.13172138, 0.72709204, 5.76874778, 1.77557845, 0.04098317],
+                [-3.78816218, -0.67583590, -4.95433863, -1.67093250, -0.24929051],
+                [0.05579709, 0.29199789, 0.00697116, 1.05956179, 0.30686995]],
+            dates, tickers),
+        'lookahead_returns': pd.DataFrame(
+            [
+                [3.13172138, 0.72709204, 5.76874778, 1.77557845, 0.04098317],
+                [-3.78816218, -0.67583590, -4.95433863, -1.67093250, -0.24929051],
+                [0.05579709, 0.29199789, 0.00697116, 1.05956179, 0.30686995],
+                [1.25459098, 6.87369275, 2.58265839, 6.92676837, 0.84632677],
+                [np.nan, np.nan, np.nan, np.nan, np.nan]],
+            dates, tickers),
+        'top_bottom_ns': [1, 2, 3]}
+    fn_correct_outputs = OrderedDict([
+        (
+            'portfolio_returns_by_date',
+            pd.DataFrame(
+                [
+                    [0.00000000, 0.00000000, 0.00000000],
+                    [0.00000000, 0.00000000, 0.00000000],
+                    [-0.14994940, -0.13402490, -0.08934993],
+                    [-0.86816581, 0.97069254, 0.64712836],
+                    [np.nan, np.nan, np.nan]],
+                dates, [1, 2, 3]))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_permutation_alpha(fn):
+    dates = pd.DatetimeIndex(['2008-08-31', '2008-09-30', '2008-10-31', '2008-11-30'])
+
+    fn_inputs = {
+        'expected_portfolio_returns_by_date': pd.Series(
+            [0.00000000, 0.00000000, 0.01859903, -0.41819699],
+            dates),
+        'n_resamples': 1000,
+        'random_state': 0}
+    fn_correct_outputs = OrderedDict([
+        (
+            't_value',
+            -0.940764456618),
+        (
+            'p_value',
+            0.761238761239)])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_bootstrap_alpha(fn):
+    dates = pd.DatetimeIndex(['2008-01-31', '2008-02-29', '2008-03-31', '2008-04-30', '2008-05-31', '2008-06-30'])
+
+    fn_inputs = {
+        'expected_portfolio_returns_by_date': pd.Series(
+            [0.01859903, -0.01819699, 0.04256723, 0.00935521, -0.00313842, 0.02759631],
+            dates),
+        'n_resamples': 1000,
+        'block_size': 2,
+        'random_state': 0}
+    fn_correct_outputs = OrderedDict([
+        (
+            't_value',
+            1.441193201046),
+        (
+            'p_value',
+            0.035964035964),
+        (
+            'confidence_interval',
+            (0.002139270000, 0.024052186667))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_ingest_quandl_zip(fn):
+    raw_csv = \
+        'ticker,date,open,adj_close,adj_volume\n' \
+        'AAA,2013-06-28,1.0,10.0,100.0\n' \
+        'AAA,2013-07-01,1.0,11.0,110.0\n' \
+        'BBB,2013-07-01,1.0,21.0,210.0\n' \
+        'CCC,2013-07-01,1.0,31.0,310.0\n' \
+        'AAA,2013-07-02,1.0,12.0,120.0\n' \
+        'BBB,2013-07-02,1.0,22.0,220.0\n' \
+        'AAA,2014-01-02,1.0,13.0,130.0\n' \
+        'BBB,2014-01-03,1.0,23.0,230.0\n'
+    expected_csv = \
+        'ticker,date,adj_close\n' \
+        'AAA,2013-07-01,11.0\n' \
+        'BBB,2013-07-01,21.0\n' \
+        'AAA,2013-07-02,12.0\n' \
+        'BBB,2013-07-02,22.0\n' \
+        'AAA,2014-01-02,13.0\n'
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = os.path.join(tmp_dir, 'bulk.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+            zip_ref.writestr('WIKI_PRICES.csv', raw_csv)
+
+        save_path = os.path.join(tmp_dir, 'eod.csv')
+        fn(zip_path, save_path, ['ticker', 'date', 'adj_close'], ['AAA', 'BBB'], '2013-07-01', '2014-01-02', chunksize=2)
+        with open(save_path) as f:
+            assert f.read() == expected_csv, 'Wrong csv saved'
+
+        partition_path = os.path.join(tmp_dir, 'eod')
+        fn(zip_path, partition_path, ['ticker', 'date', 'adj_close'], ['AAA', 'BBB'], '2013-07-01', '2014-01-02',
+           chunksize=3, partition_by='year')
+        assert sorted(os.listdir(partition_path)) == ['2013.csv', '2014.csv'], 'Wrong partitions saved'
+        with open(os.path.join(partition_path, '2014.csv')) as f:
+            assert f.read() == 'ticker,date,adj_close\nAAA,2014-01-02,13.0\n', 'Wrong partition saved'
+
+
+class _QuandlStandInHandler(BaseHTTPRequestHandler):
+    """
+    Serves the Quandl export metadata and the bulk download zip, with support for range requests.
+    """
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append((self.path, self.headers.get('Range')))
+
+        if self.path.startswith('/datatables/'):
+            body = json.dumps({'datatable_bulk_download': {'file': {
+                'link': 'http://127.0.0.1:{}/bulk.zip'.format(server.server_port),
+                'status': 'fresh',
+                'data_snapshot_time': server.snapshot_time}}}).encode()
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        start = 0
+        if self.headers.get('Range'):
+            start = int(self.headers.get('Range').split('=')[1].split('-')[0])
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, len(server.zip_bytes) - 1, len(server.zip_bytes)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(server.zip_bytes) - start))
+        self.end_headers()
+
+        end = len(server.zip_bytes)
+        if server.fail_after is not None:
+            # Drop the connection part of the way through
+            end = server.fail_after
+            server.fail_after = None
+        self.wfile.write(server.zip_bytes[start:end])
+
+
+@project_test
+def test_fetch_quandl_bulk_zip(fn):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        zip_path = os.path.join(tmp_dir, 'source.zip')
+        with zipfile.ZipFile(zip_path, 'w') as zip_ref:
+            zip_ref.writestr('WIKI_PRICES.csv', 'ticker,date,adj_close\n' + 'AAA,2013-07-01,11.0\n' * 150000)
+        with open(zip_path, 'rb') as f:
+            zip_bytes = f.read()
+
+        server = HTTPServer(('127.0.0.1', 0), _QuandlStandInHandler)
+        server.zip_bytes = zip_bytes
+        server.snapshot_time = '2018-03-27 21:46:02'
+        server.fail_after = 3 * len(zip_bytes) // 4
+        server.requests = []
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+
+        try:
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            fn_kwargs = {'cache_dir': cache_dir, 'api_url': 'http://127.0.0.1:{}/datatables'.format(server.server_port)}
+
+            # The first download is interrupted
+            try:
+                fn('KEY', 'WIKI', 'PRICES', **fn_kwargs)
+            except IOError:
+                pass
+            else:
+                assert False, 'Interrupted download should raise an IOError'
+
+            # The second download resumes where the first stopped
+            cached_zip = fn('KEY', 'WIKI', 'PRICES', **fn_kwargs)
+            with open(cached_zip, 'rb') as f:
+                assert f.read() == zip_bytes, 'Resumed download is corrupt'
+            assert server.requests[-1][1] is not None, \
+                'Download wasn\'t resumed'
+
+            # A cache hit doesn't touch the network
+            n_requests = len(server.requests)
+            assert fn('KEY', 'WIKI', 'PRICES', **fn_kwargs) == cached_zip, 'Cache miss'
+            assert len(server.requests) == n_requests, 'Cache hit made a request'
+
+            # Refreshing only downloads again when the export changes
+            assert fn('KEY', 'WIKI', 'PRICES', refresh=True, **fn_kwargs) == cached_zip, 'Cache miss'
+            assert len(server.requests) == n_requests + 1, 'Refresh downloaded an unchanged export'
+
+            # The checksum is only checked when the size or modification time of the zip changes
+            zip_stat = os.stat(cached_zip)
+            with open(cached_zip, 'r+b') as f:
+                f.write(b'corrupt')
+            os.utime(cached_zip, ns=(zip_stat.st_atime_ns, zip_stat.st_mtime_ns))
+            n_requests = len(server.requests)
+            assert fn('KEY', 'WIKI', 'PRICES', **fn_kwargs) == cached_zip, 'Cache miss'
+            assert len(server.requests) == n_requests, 'Cache hit made a request'
+
+            # A corrupt cached zip fails its checksum and is downloaded again
+            os.utime(cached_zip, ns=(zip_stat.st_atime_ns, zip_stat.st_mtime_ns + 10 ** 9))
+            cached_zip = fn('KEY', 'WIKI', 'PRICES', **fn_kwargs)
+            with open(cached_zip, 'rb') as f:
+                assert f.read() == zip_bytes, 'Corrupt download wasn\'t replaced'
+            assert len(server.requests) == n_requests + 2, 'Corrupt download wasn\'t downloaded again'
+
+            # A new export replaces the cached zip and the partial downloads of older exports
+            partial_dir = os.path.join(cache_dir, 'partial')
+            old_part_path = os.path.join(partial_dir, 'WIKI_PRICES_{}.part'.format('0' * 40))
+            other_part_path = os.path.join(partial_dir, 'WIKI_PRICES_DAILY_{}.part'.format('0' * 40))
+            for part_path in (old_part_path, other_part_path):
+                with open(part_path, 'wb') as f:
+                    f.write(zip_bytes[:100])
+            with open(zip_path, 'a+b') as f:
+                f.write(b'new export')
+            with open(zip_path, 'rb') as f:
+                server.zip_bytes = f.read()
+            server.snapshot_time = '2018-03-28 21:46:02'
+
+            new_cached_zip = fn('KEY', 'WIKI', 'PRICES', refresh=True, **fn_kwargs)
+            with open(new_cached_zip, 'rb') as f:
+                assert f.read() == server.zip_bytes, 'New export wasn\'t downloaded'
+            assert os.listdir(os.path.join(cache_dir, 'objects')) == [os.path.basename(new_cached_zip)], \
+                'Replaced zip wasn\'t removed'
+            assert os.listdir(partial_dir) == [os.path.basename(other_part_path)], \
+                'Wrong partial downloads removed'
+        finally:
+            server.shutdown()
+            server.server_close()
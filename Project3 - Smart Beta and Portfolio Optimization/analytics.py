@@ -0,0 +1,159 @@
+import numpy as np
+import pandas as pd
+
+
+def _values(returns):
+    if isinstance(returns, (pd.DataFrame, pd.Series)):
+        return returns.values
+    return np.asarray(returns)
+
+
+def _wrap(values, like):
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(values, like.index, like.columns, copy=False)
+    return values
+
+
+def tracking_errors(benchmark_returns_by_date, variant_returns_by_date, n_trading_days_in_year=252):
+    """
+    Calculate the tracking error of many variants against one benchmark.
+
+    Same as `tracking_error` for each variant. The differences go into one buffer, which is demeaned
+    and squared in place, so the variance of every variant comes out of one pass. NaN dates are
+    skipped for each variant.
+
+    Parameters
+    ----------
+    benchmark_returns_by_date : Pandas Series or 1 dimensional Ndarray
+        The benchmark returns for each date
+    variant_returns_by_date : DataFrame or 2 dimensional Ndarray
+        The returns for each variant (rows) and date (columns)
+    n_trading_days_in_year: int
+        Number of trading days in a year
+
+    Returns
+    -------
+    tracking_errors : Pandas Series or 1 dimensional Ndarray
+        The tracking error of each variant
+    """
+    if isinstance(variant_returns_by_date, pd.DataFrame) and isinstance(benchmark_returns_by_date, pd.Series):
+        assert benchmark_returns_by_date.index.equals(variant_returns_by_date.columns)
+
+    differences = np.subtract(_values(variant_returns_by_date), _values(benchmark_returns_by_date))
+    is_nan = np.isnan(differences)
+    differences[is_nan] = 0.0
+    n_dates = differences.shape[1] - is_nan.sum(axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        differences -= (differences.sum(axis=1) / n_dates)[:, None]
+        differences[is_nan] = 0.0
+        variances = np.einsum('ij,ij->i', differences, differences) / (n_dates - 1)
+        errors = np.sqrt(n_trading_days_in_year) * np.sqrt(variances)
+
+    if isinstance(variant_returns_by_date, pd.DataFrame):
+        return pd.Series(errors, variant_returns_by_date.index)
+    return errors
+
+
+def cumulative_returns(returns_by_date, out=None):
+    """
+    Calculate the cumulative returns of many variants.
+
+    Same as the `calculate_cumulative_returns` of each variant's returns by date. NaN dates stay NaN
+    and don't change the cumulative return.
+
+    Parameters
+    ----------
+    returns_by_date : DataFrame or 2 dimensional Ndarray
+        The returns for each variant (rows) and date (columns)
+    out : 2 dimensional Ndarray
+        Float64 buffer with the shape of `returns_by_date` to write the cumulative returns into.
+        Allocated if None
+
+    Returns
+    -------
+    cumulative_returns : DataFrame or 2 dimensional Ndarray
+        Cumulative returns for each variant and date
+    """
+    values = _values(returns_by_date)
+    if out is None:
+        out = np.empty(values.shape)
+
+    is_nan = np.isnan(values)
+    np.add(values, 1.0, out=out)
+    out[is_nan] = 1.0
+    np.cumprod(out, axis=1, out=out)
+    out[is_nan] = np.nan
+
+    return _wrap(out, returns_by_date)
+
+
+def drawdowns(cumulative_returns, out=None):
+    """
+    Calculate the drawdown of many variants from their cumulative returns.
+
+    Parameters
+    ----------
+    cumulative_returns : DataFrame or 2 dimensional Ndarray
+        Cumulative returns for each variant (rows) and date (columns)
+    out : 2 dimensional Ndarray
+        Float64 buffer with the shape of `cumulative_returns` to write the drawdowns into. Allocated if None
+
+    Returns
+    -------
+    drawdowns : DataFrame or 2 dimensional Ndarray
+        The fall from the highest cumulative return so far, for each variant and date
+    """
+    values = _values(cumulative_returns)
+    if out is None:
+        out = np.empty(values.shape)
+
+    # Running peak first, then divided into in place. fmax skips NaNs, so a NaN date doesn't reset the peak.
+    np.fmax.accumulate(values, axis=1, out=out)
+    np.divide(values, out, out=out)
+    out -= 1.0
+
+    return _wrap(out, cumulative_returns)
+
+
+def summarize_variants(benchmark_returns_by_date, variant_returns_by_date, n_trading_days_in_year=252):
+    """
+    Compare many smart beta variants against the index in one call.
+
+    Parameters
+    ----------
+    benchmark_returns_by_date : Pandas Series
+        The benchmark returns for each date
+    variant_returns_by_date : DataFrame
+        The returns for each variant (rows) and date (columns)
+    n_trading_days_in_year: int
+        Number of trading days in a year
+
+    Returns
+    -------
+    summary : DataFrame
+        Tracking error, total cumulative return and maximum drawdown for each variant
+    variant_cumulative_returns : DataFrame
+        Cumulative returns for each variant and date
+    """
+    variant_cumulative_returns = cumulative_returns(variant_returns_by_date)
+    cumulative_values = variant_cumulative_returns.values
+
+    # Last cumulative return of each variant, skipping trailing NaN dates
+    has_value = ~np.isnan(cumulative_values)
+    last_dates = cumulative_values.shape[1] - 1 - np.argmax(has_value[:, ::-1], axis=1)
+    total_returns = cumulative_values[np.arange(len(cumulative_values)), last_dates]
+
+    with np.errstate(invalid='ignore'):
+        max_drawdowns = np.nanmin(drawdowns(cumulative_values), axis=1)
+
+    summary = pd.DataFrame(
+        {
+            'tracking_error': tracking_errors(
+                benchmark_returns_by_date, variant_returns_by_date, n_trading_days_in_year).values,
+            'cumulative_return': total_returns,
+            'max_drawdown': max_drawdowns},
+        variant_returns_by_date.index,
+        ['tracking_error', 'cumulative_return', 'max_drawdown'])
+
+    return summary, variant_cumulative_returns
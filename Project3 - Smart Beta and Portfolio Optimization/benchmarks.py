@@ -0,0 +1,159 @@
+import time
+import timeit
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import price_store
+import weighting
+
+
+def _best_time(fn, repeat):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def _measure(fn):
+    tracemalloc.start()
+    start_time = time.time()
+    fn()
+    elapsed_time = time.time() - start_time
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return elapsed_time, peak_memory / 2 ** 20
+
+
+def generate_long_prices(n_dates, n_tickers, missing_percent=0.05, seed=0):
+    """
+    Generate a random long format price DataFrame, like the one in eod-quotemedia.csv.
+
+    Parameters
+    ----------
+    n_dates : int
+        Number of trading days
+    n_tickers : int
+        Number of tickers
+    missing_percent : float
+        The percent of (date, ticker) rows to drop
+    seed : int
+        Random seed
+
+    Returns
+    -------
+    df : DataFrame
+        Long format prices, with one row for each ticker and date
+    """
+    random_state = np.random.RandomState(seed)
+    dates = pd.date_range('2000-01-03', periods=n_dates, freq='B')
+    tickers = np.array(['T{:05d}'.format(i) for i in range(n_tickers)], dtype=object)
+
+    df = pd.DataFrame({
+        'ticker': np.repeat(tickers, n_dates),
+        'date': np.tile(dates.values, n_tickers)})
+    df = df[random_state.rand(len(df)) >= missing_percent].reset_index(drop=True)
+    df['adj_close'] = random_state.lognormal(3.0, 1.0, len(df))
+    df['adj_volume'] = random_state.lognormal(14.0, 1.0, len(df))
+    df['dividends'] = np.where(random_state.rand(len(df)) < 0.01, random_state.rand(len(df)), 0.0)
+
+    return df
+
+
+def benchmark_pivot_fields(n_dates=2500, n_tickers=500, fields=('adj_close', 'adj_volume', 'dividends'), repeat=3):
+    """
+    Time `price_store.pivot_fields` against one `pivot` call per field.
+
+    Parameters
+    ----------
+    n_dates : int
+        Number of trading days
+    n_tickers : int
+        Number of tickers
+    fields : list of str
+        The fields to pivot
+    repeat : int
+        Number of runs to take the best time from
+
+    Returns
+    -------
+    timings : Pandas Series
+        Best time in seconds for each implementation
+    """
+    df = generate_long_prices(n_dates, n_tickers)
+    fields = list(fields)
+
+    def pivot_per_field():
+        return {field: df.reset_index().pivot(index='date', columns='ticker', values=field) for field in fields}
+
+    expected = pivot_per_field()
+    field_dfs = price_store.pivot_fields(df, fields)
+    for field in fields:
+        assert field_dfs[field].equals(expected[field])
+
+    return pd.Series({
+        'pivot_per_field': _best_time(pivot_per_field, repeat),
+        'pivot_fields': _best_time(lambda: price_store.pivot_fields(df, fields), repeat)})
+
+
+def _frame_dollar_volume_weights(close, volume):
+    # The starter generate_dollar_volume_weights, without the prints
+    dollar_volume = close * volume
+    dollar_volume['total_dollar'] = dollar_volume.sum(axis=1)
+    return dollar_volume.iloc[:, :-1].div(dollar_volume['total_dollar'], axis=0)
+
+
+def _frame_dividend_weights(dividends):
+    # The starter calculate_dividend_weights
+    rolling_dividends = dividends.copy()
+    for col in rolling_dividends:
+        rolling_dividends[col] = rolling_dividends[col].cumsum()
+    rolling_dividends['total_dividend'] = rolling_dividends.sum(axis=1)
+    return rolling_dividends.iloc[:, :-1].div(rolling_dividends['total_dividend'], axis=0)
+
+
+def benchmark_weighting(n_dates=2500, n_tickers=500):
+    """
+    Time and peak memory of the weighting functions, before and after the `weighting` kernels.
+
+    Parameters
+    ----------
+    n_dates : int
+        Number of trading days
+    n_tickers : int
+        Number of tickers
+
+    Returns
+    -------
+    results : DataFrame
+        Seconds and peak MiB for each implementation
+    """
+    field_dfs = price_store.pivot_fields(
+        generate_long_prices(n_dates, n_tickers), ['adj_close', 'adj_volume', 'dividends'])
+    close, volume, dividends = field_dfs['adj_close'], field_dfs['adj_volume'], field_dfs['dividends']
+    out = np.empty(close.shape)
+
+    assert np.allclose(
+        weighting.generate_dollar_volume_weights(close, volume).values,
+        _frame_dollar_volume_weights(close, volume).values,
+        equal_nan=True)
+    assert np.allclose(
+        weighting.calculate_dividend_weights(dividends).values,
+        _frame_dividend_weights(dividends).values,
+        equal_nan=True)
+
+    results = {
+        'dollar_volume_frame': _measure(lambda: _frame_dollar_volume_weights(close, volume)),
+        'dollar_volume_kernel': _measure(lambda: weighting.generate_dollar_volume_weights(close, volume)),
+        'dollar_volume_kernel_out': _measure(lambda: weighting.generate_dollar_volume_weights(close, volume, out=out)),
+        'dividend_frame': _measure(lambda: _frame_dividend_weights(dividends)),
+        'dividend_kernel': _measure(lambda: weighting.calculate_dividend_weights(dividends))}
+
+    return pd.DataFrame(results, index=['seconds', 'peak_mib']).T
+
+
+if __name__ == '__main__':
+    print('Pivot adj_close, adj_volume and dividends (seconds):')
+    print(benchmark_pivot_fields())
+    print()
+    print('Weight 2500 dates x 500 tickers:')
+    print(benchmark_weighting())
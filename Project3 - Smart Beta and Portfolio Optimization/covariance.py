@@ -0,0 +1,327 @@
+import numpy as np
+from scipy.linalg import blas
+
+
+class RollingCovariance(object):
+    """
+    Covariance of the returns over a sliding window of dates.
+
+    Keeps the sum and the cross-product matrix of the returns in the window. Sliding the window by
+    k dates adds the cross-products of the k new dates and subtracts those of the k dates that drop
+    out, which costs O(k * N^2) instead of the O(W * N^2) of recomputing the window. NaN returns are
+    counted as 0, the same as `np.cov(returns.T.fillna(0))`.
+    """
+    def __init__(self, window_returns, refresh_every=100):
+        """
+        Parameters
+        ----------
+        window_returns : 2 dimensional Ndarray
+            Returns for each date (rows) and ticker (columns) in the first window
+        refresh_every : int
+            Number of updates after which the sums are recomputed from the window, to stop rounding
+            errors from building up. Never recomputes if None
+        """
+        self._window = np.array(window_returns, dtype=np.float64)
+        self._window[np.isnan(self._window)] = 0.0
+        assert self._window.ndim == 2 and len(self._window) > 1, 'The window needs at least 2 dates'
+
+        self.refresh_every = refresh_every
+        self._start = 0
+        self._refresh()
+
+    @property
+    def window(self):
+        return len(self._window)
+
+    def _refresh(self):
+        window_returns = np.roll(self._window, -self._start, axis=0)
+        self._window = window_returns
+        self._start = 0
+        self._sums = window_returns.sum(axis=0)
+        # Fortran order so BLAS can accumulate into it without a copy
+        self._cross_products = np.asfortranarray(np.dot(window_returns.T, window_returns))
+        self._n_updates = 0
+
+    def update(self, new_returns):
+        """
+        Slide the window forward by adding the returns of new dates and dropping the oldest ones.
+
+        Parameters
+        ----------
+        new_returns : 2 dimensional Ndarray
+            Returns for each new date (rows) and ticker (columns), in date order
+        """
+        new_returns = np.array(new_returns, dtype=np.float64, ndmin=2)
+        new_returns[np.isnan(new_returns)] = 0.0
+        assert new_returns.shape[1] == self._window.shape[1]
+        n_new = len(new_returns)
+
+        if n_new >= self.window:
+            self._window = new_returns[-self.window:]
+            self._refresh()
+            return
+
+        positions = (self._start + np.arange(n_new)) % self.window
+        old_returns = self._window[positions]
+
+        self._sums += new_returns.sum(axis=0) - old_returns.sum(axis=0)
+        # One rank-2k update in place: cross_products += new.T * new - old.T * old
+        self._cross_products = blas.dgemm(
+            1.0,
+            np.vstack([new_returns, old_returns]),
+            np.vstack([new_returns, -old_returns]),
+            beta=1.0,
+            c=self._cross_products,
+            trans_a=True,
+            overwrite_c=True)
+
+        self._window[positions] = new_returns
+        self._start = (self._start + n_new) % self.window
+        self._n_updates += 1
+
+        if self.refresh_every is not None and self._n_updates >= self.refresh_every:
+            self._refresh()
+
+    def covariance(self):
+        """
+        Get the covariance of the returns in the current window.
+
+        Returns
+        -------
+        returns_covariance : 2 dimensional Ndarray
+            The covariance of the returns
+        """
+        returns_covariance = np.outer(self._sums, self._sums / -self.window)
+        returns_covariance += self._cross_products
+        returns_covariance /= self.window - 1
+
+        return returns_covariance
+
+
+def rolling_covariances(returns, shift_size, chunk_size, refresh_every=100):
+    """
+    Get the covariance of the returns for each rebalance of the portfolio.
+
+    Yields the same windows as `rebalance_portfolio`, which looks back `chunk_size` days from every
+    `shift_size`th day.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    shift_size : int
+        The number of days between each rebalance
+    chunk_size : int
+        The number of days to look in the past for rebalancing
+    refresh_every : int
+        Number of updates after which the sums are recomputed from the window
+
+    Returns
+    -------
+    covariances : generator of (int, 2 dimensional Ndarray)
+        Position of the rebalance date in `returns` and the covariance of the returns up to it
+    """
+    assert shift_size > 0
+    assert chunk_size > 1
+
+    returns_values = np.asarray(returns.values if hasattr(returns, 'values') else returns)
+    days = len(returns_values)
+    if chunk_size > days - 1:
+        return
+
+    rolling_covariance = RollingCovariance(returns_values[:chunk_size], refresh_every)
+    yield chunk_size - 1, rolling_covariance.covariance()
+
+    for day in range(chunk_size - 1 + shift_size, days - 1, shift_size):
+        rolling_covariance.update(returns_values[day - shift_size + 1:day + 1])
+        yield day, rolling_covariance.covariance()
+
+
+def _demeaned_returns(returns):
+    returns_values = np.array(returns.values if hasattr(returns, 'values') else returns, dtype=np.float64)
+    returns_values[np.isnan(returns_values)] = 0.0
+    returns_values -= returns_values.mean(axis=0)
+
+    return returns_values
+
+
+def sample_covariance(returns):
+    """
+    Calculate the sample covariance of the returns, the same as `get_covariance_returns`.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+
+    Returns
+    -------
+    returns_covariance : 2 dimensional Ndarray
+        The covariance of the returns
+    """
+    returns_values = _demeaned_returns(returns)
+
+    return np.dot(returns_values.T, returns_values) / (len(returns_values) - 1)
+
+
+def ledoit_wolf_covariance(returns):
+    """
+    Calculate the covariance of the returns, shrunk towards a multiple of the identity.
+
+    Drop-in replacement for `get_covariance_returns`. With fewer dates than tickers the sample
+    covariance is singular. Ledoit and Wolf's shrinkage mixes it with mu * I, where mu is the average
+    variance, with the weight that minimizes the expected squared error. Unlike the sample covariance,
+    the result is positive definite whenever it is shrunk at all.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+
+    Returns
+    -------
+    returns_covariance : 2 dimensional Ndarray
+        The shrunk covariance of the returns
+    """
+    returns_values = _demeaned_returns(returns)
+    n_dates, n_tickers = returns_values.shape
+
+    returns_covariance = np.dot(returns_values.T, returns_values)
+    returns_covariance /= n_dates
+    mu = np.trace(returns_covariance) / n_tickers
+
+    # ||S - mu * I||^2 is the spread of S around the target, and the variance of the estimate S is the
+    # average ||x_t * x_t' - S||^2 / n_dates, which expands to (sum_t ||x_t||^4 - n_dates * ||S||^2) / n_dates^2
+    squared_norm = np.einsum('ij,ij->', returns_covariance, returns_covariance)
+    distance = squared_norm - 2.0 * mu * np.trace(returns_covariance) + n_tickers * mu ** 2
+    squared_date_norms = np.einsum('ij,ij->i', returns_values, returns_values)
+    estimate_variance = (np.dot(squared_date_norms, squared_date_norms) / n_dates - squared_norm) / n_dates
+    shrinkage = 1.0 if distance == 0.0 else min(estimate_variance, distance) / distance
+
+    # Scale to the same n_dates - 1 denominator as the sample covariance
+    returns_covariance *= (1.0 - shrinkage) * n_dates / (n_dates - 1)
+    returns_covariance.flat[::n_tickers + 1] += shrinkage * mu * n_dates / (n_dates - 1)
+
+    return returns_covariance
+
+
+class LowRankCovariance(object):
+    """
+    Covariance in factor-plus-diagonal form, B * diag(f) * B.T + diag(s).
+
+    Stores the N x K factor betas and the factor and idiosyncratic variances instead of the N x N
+    matrix, which takes O(N * K) memory and multiplies a vector in O(N * K). It has the `shape`,
+    `__len__` and `dot` of an Ndarray, so `ProjectedGradientOptimizer` and `get_optimal_weights` take it
+    in place of the dense covariance. `IndexTrackingOptimizer.solve_low_rank` solves with it in cvxpy.
+    """
+    def __init__(self, factor_betas, factor_variances, idiosyncratic_variances):
+        """
+        Parameters
+        ----------
+        factor_betas : 2 dimensional Ndarray
+            Exposure of each ticker (rows) to each factor (columns)
+        factor_variances : 1 dimensional Ndarray
+            The variance of each factor. The factors are uncorrelated
+        idiosyncratic_variances : 1 dimensional Ndarray
+            The variance of each ticker that the factors don't explain
+        """
+        self.factor_betas = np.asarray(factor_betas, dtype=np.float64)
+        self.factor_variances = np.asarray(factor_variances, dtype=np.float64)
+        self.idiosyncratic_variances = np.asarray(idiosyncratic_variances, dtype=np.float64)
+        assert self.factor_betas.ndim == 2
+        assert self.factor_variances.shape == (self.factor_betas.shape[1],)
+        assert self.idiosyncratic_variances.shape == (self.factor_betas.shape[0],)
+
+    @property
+    def shape(self):
+        return (len(self), len(self))
+
+    @property
+    def n_factors(self):
+        return len(self.factor_variances)
+
+    def __len__(self):
+        return len(self.factor_betas)
+
+    def factor(self):
+        """
+        Get the factor of the systematic part, G with G.T * G = B * diag(f) * B.T.
+
+        Returns
+        -------
+        covariance_factor : 2 dimensional Ndarray
+            One row for each factor, which can be passed to `IndexTrackingOptimizer.solve_factor`
+        """
+        return (self.factor_betas * np.sqrt(self.factor_variances)).T
+
+    def dot(self, x):
+        """
+        Multiply the covariance by a vector or the columns of a matrix, without building the covariance.
+
+        Parameters
+        ----------
+        x : 1 or 2 dimensional Ndarray
+            Weights for each ticker
+
+        Returns
+        -------
+        product : 1 or 2 dimensional Ndarray
+            The covariance times `x`
+        """
+        x = np.asarray(x)
+        factor_exposures = np.dot(self.factor_betas.T, x)
+        factor_exposures *= self.factor_variances.reshape((-1,) + (1,) * (x.ndim - 1))
+
+        return np.dot(self.factor_betas, factor_exposures) + \
+            self.idiosyncratic_variances.reshape((-1,) + (1,) * (x.ndim - 1)) * x
+
+    def dense(self):
+        """
+        Build the full covariance matrix.
+
+        Returns
+        -------
+        returns_covariance : 2 dimensional Ndarray
+            The covariance of the returns
+        """
+        returns_covariance = np.dot(self.factor_betas * self.factor_variances, self.factor_betas.T)
+        returns_covariance.flat[::len(self) + 1] += self.idiosyncratic_variances
+
+        return returns_covariance
+
+
+def factor_covariance(returns, n_factors=20):
+    """
+    Estimate the covariance of the returns with a statistical factor model.
+
+    Drop-in replacement for `get_covariance_returns` that returns a `LowRankCovariance` instead of an
+    Ndarray. The factors are the top `n_factors` principal components of the returns, taken from a thin
+    SVD of the demeaned returns, so the N x N sample covariance is never built. The idiosyncratic
+    variances are what is left of each ticker's sample variance, so the diagonal matches the sample
+    covariance.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    n_factors : int
+        Number of principal components to keep. Capped at the rank of the returns
+
+    Returns
+    -------
+    returns_covariance : LowRankCovariance
+        The covariance of the returns
+    """
+    assert n_factors > 0
+    returns_values = _demeaned_returns(returns)
+    returns_values /= np.sqrt(len(returns_values) - 1)
+
+    _, singular_values, components = np.linalg.svd(returns_values, full_matrices=False)
+    factor_betas = components[:n_factors].T
+    factor_variances = singular_values[:n_factors] ** 2
+
+    sample_variances = np.einsum('ij,ij->j', returns_values, returns_values)
+    explained_variances = np.dot(factor_betas ** 2, factor_variances)
+    idiosyncratic_variances = np.maximum(sample_variances - explained_variances, 0.0)
+
+    return LowRankCovariance(factor_betas, factor_variances, idiosyncratic_variances)
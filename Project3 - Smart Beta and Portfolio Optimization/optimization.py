@@ -0,0 +1,657 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+
+import cvxpy as cvx
+import numpy as np
+from tqdm import tqdm
+
+from covariance import LowRankCovariance, rolling_covariances
+
+
+PENALTIES = ('norm', 'squared_norm')
+METHODS = ('cvxpy', 'projected_gradient')
+# Number of times to widen the search for rho by a factor of e^2 before giving up
+MAX_BRACKET_STEPS = 50
+
+
+def covariance_factor(covariance_returns):
+    """
+    Factor a covariance matrix P into G, with G.T * G = P.
+
+    Parameters
+    ----------
+    covariance_returns : 2 dimensional Ndarray
+        The covariance of the returns
+
+    Returns
+    -------
+    covariance_factor : 2 dimensional Ndarray
+        The factor of the covariance, with one row for each eigenvector
+    """
+    eigenvalues, eigenvectors = np.linalg.eigh(covariance_returns)
+
+    # Round off can make the eigenvalues of a singular covariance slightly negative
+    return (eigenvectors * np.sqrt(np.maximum(eigenvalues, 0.0))).T
+
+
+def returns_factor(returns):
+    """
+    Get the covariance factor G of a window of returns, with G.T * G = np.cov(returns.T.fillna(0)).
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+
+    Returns
+    -------
+    covariance_factor : 2 dimensional Ndarray
+        The demeaned returns, scaled by 1 / sqrt(number of dates - 1)
+    """
+    returns_values = np.array(returns.values if hasattr(returns, 'values') else returns, dtype=np.float64)
+    returns_values[np.isnan(returns_values)] = 0.0
+    returns_values -= returns_values.mean(axis=0)
+    returns_values /= np.sqrt(len(returns_values) - 1)
+
+    return returns_values
+
+
+class IndexTrackingOptimizer(object):
+    """
+    The `get_optimal_weights` problem, built once and re-solved for each rebalance.
+
+    By default the variance is quad_form(x, P), the same formulation as `get_optimal_weights`, with the
+    covariance P and the index weights as cvxpy Parameters. A new rebalance only sets their values and
+    re-solves the same problem, which skips building the problem every time. A quad_form of a Parameter
+    isn't DPP, so cvxpy still compiles the problem on every solve. The DPP form, sum_squares(G @ x) with
+    the factor G as the Parameter, only compiles once, but the solver gets a larger problem and the
+    re-solves end up slower than compiling the dense form again.
+
+    With `n_factors`, the covariance instead enters through a factor G, as sum_squares(G @ x) =
+    quad_form(x, G.T @ G), for covariances that come as a factor, like a `LowRankCovariance`. With
+    `idiosyncratic`, the variance also has a diagonal part sum_squares(sqrt(s) * x). This form is only
+    worth it when G has far fewer rows than tickers. With solvers that take the quadratic objective
+    directly, the extra equality constraints make it slower than the dense form for window-sized factors.
+    """
+    def __init__(self, n_assets, n_factors=None, scale=2.0, solver=None, penalty='norm', idiosyncratic=False):
+        """
+        Parameters
+        ----------
+        n_assets : int
+            Number of tickers
+        n_factors : int
+            Number of rows in the covariance factor, to solve with `solve_factor`. Use the number of dates
+            in the window when solving with `returns_factor`. Solves with the covariance matrix if None
+        scale : float
+            The penalty factor for weights the deviate from the index
+        solver : str
+            The cvxpy solver to use. Uses the cvxpy default if None
+        penalty : str
+            How to penalize the distance to the index. Either 'norm', ||x - index_weights||, or
+            'squared_norm', ||x - index_weights||^2
+        idiosyncratic : bool
+            Add an idiosyncratic variance for each ticker to the variance of the factor
+        """
+        assert penalty in PENALTIES, 'Unknown penalty {}'.format(penalty)
+        assert n_factors is not None or not idiosyncratic, 'idiosyncratic needs n_factors'
+        self.n_assets = n_assets
+        self.n_factors = n_factors
+        self.scale = scale
+        self.solver = solver
+        self.idiosyncratic = idiosyncratic
+
+        self._index_weights = cvx.Parameter(n_assets)
+        self._x = cvx.Variable(n_assets)
+        constraints = [self._x >= 0, cvx.sum(self._x) == 1]
+
+        if n_factors is None:
+            self._covariance_returns = cvx.Parameter((n_assets, n_assets), PSD=True)
+            portfolio_variance = cvx.quad_form(self._x, self._covariance_returns)
+        else:
+            self._covariance_factor = cvx.Parameter((n_factors, n_assets))
+            # The factor exposures get their own variable, so the variance is a plain sum of squares
+            factor_exposures = cvx.Variable(n_factors)
+            portfolio_variance = cvx.sum_squares(factor_exposures)
+            constraints.append(factor_exposures == self._covariance_factor @ self._x)
+        if idiosyncratic:
+            self._idiosyncratic_std = cvx.Parameter(n_assets, nonneg=True)
+            portfolio_variance += cvx.sum_squares(cvx.multiply(self._idiosyncratic_std, self._x))
+        if penalty == 'norm':
+            distance_to_index = cvx.norm(self._x - self._index_weights)
+        else:
+            distance_to_index = cvx.sum_squares(self._x - self._index_weights)
+        objective = cvx.Minimize(portfolio_variance + scale * distance_to_index)
+        self._problem = cvx.Problem(objective, constraints)
+
+    def _solve(self, index_weights):
+        self._index_weights.value = np.asarray(index_weights, dtype=np.float64)
+        self._problem.solve(solver=self.solver, warm_start=True)
+
+        return np.array(self._x.value).reshape(self.n_assets)
+
+    def solve_factor(self, covariance_factor, index_weights, idiosyncratic_variances=None):
+        """
+        Find the optimal weights for a covariance given by its factor.
+
+        Parameters
+        ----------
+        covariance_factor : 2 dimensional Ndarray
+            The covariance factor G, with G.T * G the covariance of the returns
+        index_weights : Pandas Series
+            Index weights for all tickers at a period in time
+        idiosyncratic_variances : 1 dimensional Ndarray
+            The variance of each ticker to add to G.T * G. Only used with `idiosyncratic`
+
+        Returns
+        -------
+        x : 1 dimensional Ndarray
+            The solution for x
+        """
+        assert self.n_factors is not None, 'Solving with a covariance factor needs n_factors'
+        assert (idiosyncratic_variances is not None) == self.idiosyncratic, \
+            'Pass idiosyncratic_variances exactly when the optimizer was built with idiosyncratic'
+        self._covariance_factor.value = np.asarray(covariance_factor, dtype=np.float64)
+        if self.idiosyncratic:
+            self._idiosyncratic_std.value = np.sqrt(np.asarray(idiosyncratic_variances, dtype=np.float64))
+
+        return self._solve(index_weights)
+
+    def solve(self, covariance_returns, index_weights):
+        """
+        Find the optimal weights.
+
+        Parameters
+        ----------
+        covariance_returns : 2 dimensional Ndarray
+            The covariance of the returns
+        index_weights : Pandas Series
+            Index weights for all tickers at a period in time
+
+        Returns
+        -------
+        x : 1 dimensional Ndarray
+            The solution for x
+        """
+        if self.n_factors is not None:
+            assert self.n_factors == self.n_assets and not self.idiosyncratic, \
+                'Solving with a covariance matrix needs n_factors None, or n_factors == n_assets'
+            return self.solve_factor(covariance_factor(covariance_returns), index_weights)
+
+        covariance_returns = np.asarray(covariance_returns, dtype=np.float64)
+        # Rounding in the covariance can leave it slightly asymmetric, which the PSD Parameter rejects
+        self._covariance_returns.value = (covariance_returns + covariance_returns.T) / 2.0
+
+        return self._solve(index_weights)
+
+    def solve_low_rank(self, covariance_returns, index_weights):
+        """
+        Find the optimal weights for a covariance in factor-plus-diagonal form.
+
+        Parameters
+        ----------
+        covariance_returns : LowRankCovariance
+            The covariance of the returns
+        index_weights : Pandas Series
+            Index weights for all tickers at a period in time
+
+        Returns
+        -------
+        x : 1 dimensional Ndarray
+            The solution for x
+        """
+        assert self.idiosyncratic and self.n_factors == covariance_returns.n_factors, \
+            'Solving with a LowRankCovariance needs idiosyncratic and n_factors == its number of factors'
+
+        return self.solve_factor(
+            covariance_returns.factor(), index_weights, covariance_returns.idiosyncratic_variances)
+
+
+def project_to_simplex(v):
+    """
+    Find the closest point to `v` with x >= 0 and sum(x) == 1.
+
+    Parameters
+    ----------
+    v : 1 dimensional Ndarray
+        The point to project
+
+    Returns
+    -------
+    x : 1 dimensional Ndarray
+        The projection of `v`
+    """
+    sorted_v = np.sort(v)[::-1]
+    cumulative_sums = np.cumsum(sorted_v) - 1.0
+    n_positive = np.count_nonzero(sorted_v * np.arange(1, len(v) + 1) > cumulative_sums)
+    threshold = cumulative_sums[n_positive - 1] / n_positive
+
+    return np.maximum(v - threshold, 0.0)
+
+
+def _largest_eigenvalue(covariance_returns, tol=1e-6, max_iter=1000):
+    """
+    Estimate the largest eigenvalue of a covariance with power iteration.
+    """
+    v = np.full(len(covariance_returns), 1.0 / np.sqrt(len(covariance_returns)))
+    eigenvalue = 0.0
+
+    for _ in range(max_iter):
+        w = covariance_returns.dot(v)
+        new_eigenvalue = np.linalg.norm(w)
+        if new_eigenvalue == 0.0:
+            return 0.0
+        v = w / new_eigenvalue
+        if abs(new_eigenvalue - eigenvalue) <= tol * new_eigenvalue:
+            break
+        eigenvalue = new_eigenvalue
+
+    # Power iteration approaches the eigenvalue from below. Leave some room so the steps stay stable.
+    return 1.01 * new_eigenvalue
+
+
+def _tracks_index(covariance_returns, index_weights, scale):
+    """
+    Check if holding the index weights exactly is optimal for the 'norm' penalty.
+
+    It is when the variance gradient 2 * P * w is within `scale` of the normal cone of the
+    constraints at w, which is {l * 1 - m : m >= 0, m = 0 where w > 0}.
+    """
+    if (index_weights < 0).any() or not np.isclose(index_weights.sum(), 1.0, rtol=0.0, atol=1e-12):
+        return False
+
+    gradient = 2.0 * covariance_returns.dot(index_weights)
+    held = index_weights > 0
+
+    # The distance for a shift l is the norm of g + l over the held tickers and of min(g + l, 0)
+    # over the rest. Its derivative in l is increasing, so bisect for the l that minimizes it.
+    low, high = -gradient.max() - 1.0, -gradient.min() + 1.0
+    for _ in range(200):
+        shift = (low + high) / 2.0
+        shifted = gradient + shift
+        if shifted[held].sum() + np.minimum(shifted[~held], 0.0).sum() > 0.0:
+            high = shift
+        else:
+            low = shift
+    shifted = gradient + (low + high) / 2.0
+    distance = np.sqrt(np.sum(shifted[held] ** 2) + np.sum(np.minimum(shifted[~held], 0.0) ** 2))
+
+    return distance <= scale
+
+
+class ProjectedGradientOptimizer(object):
+    """
+    Dedicated solver for the `get_optimal_weights` problem.
+
+    The 'squared_norm' penalty gives a smooth, strongly convex problem on the simplex, which is solved
+    with accelerated projected gradient (FISTA with adaptive restarts) and the sort-based simplex
+    projection. For the 'norm' penalty, the solution x is also the solution of the squared problem
+    with the penalty rho / 2 * ||x - w||^2 where rho * ||x - w|| = scale. The solver searches for that
+    rho, after checking if x = w is optimal, which it is whenever the penalty outweighs the variance.
+    Each solve starts from the last solution, which is close for consecutive rebalances. The covariance
+    is only used through products with a vector, so a `LowRankCovariance` solves in O(N * K) per step.
+    """
+    def __init__(self, scale=2.0, penalty='norm', tol=1e-8, max_iter=100000):
+        """
+        Parameters
+        ----------
+        scale : float
+            The penalty factor for weights the deviate from the index
+        penalty : str
+            How to penalize the distance to the index. Either 'norm', ||x - index_weights||, or
+            'squared_norm', ||x - index_weights||^2
+        tol : float
+            Stop when no weight changes by more than this in a step
+        max_iter : int
+            Maximum number of gradient steps for each squared problem
+        """
+        assert penalty in PENALTIES, 'Unknown penalty {}'.format(penalty)
+        self.scale = scale
+        self.penalty = penalty
+        self.tol = tol
+        self.max_iter = max_iter
+
+        self._x = None
+        self._rho = None
+
+    def _solve_squared(self, covariance_returns, index_weights, rho, largest_eigenvalue, x):
+        """
+        Minimize x' * P * x + rho / 2 * ||x - w||^2 on the simplex, starting from `x`.
+        """
+        lipschitz = 2.0 * largest_eigenvalue + rho
+        step = 1.0 / lipschitz
+        condition = rho / lipschitz
+        momentum = (1.0 - np.sqrt(condition)) / (1.0 + np.sqrt(condition))
+
+        y = x
+        for _ in range(self.max_iter):
+            gradient = 2.0 * covariance_returns.dot(y) + rho * (y - index_weights)
+            new_x = project_to_simplex(y - step * gradient)
+            change = new_x - x
+            if np.abs(change).max() <= self.tol:
+                return new_x
+
+            if np.dot(y - new_x, change) > 0.0:
+                # Momentum is pointing uphill, so restart from the new point
+                y = new_x
+            else:
+                y = new_x + momentum * change
+            x = new_x
+
+        return x
+
+    def _solve_norm(self, covariance_returns, index_weights, largest_eigenvalue, x):
+        if _tracks_index(covariance_returns, index_weights, self.scale):
+            return index_weights.copy()
+
+        def rho_error(rho, x):
+            x = self._solve_squared(covariance_returns, index_weights, rho, largest_eigenvalue, x)
+            return np.log(max(rho * np.linalg.norm(x - index_weights), 1e-300)) - np.log(self.scale), x
+
+        # rho * ||x(rho) - w|| increases with rho. Bracket the root in log(rho), starting from the last
+        # rebalance's rho or where the curvatures of the variance and the penalty balance.
+        low = high = np.log(self._rho if self._rho is not None else 2.0 * largest_eigenvalue)
+        low_error, x = rho_error(np.exp(low), x)
+        high_error = low_error
+        for _ in range(MAX_BRACKET_STEPS):
+            if low_error <= 0.0:
+                break
+            high, high_error = low, low_error
+            low -= 2.0
+            low_error, x = rho_error(np.exp(low), x)
+        for _ in range(MAX_BRACKET_STEPS):
+            if high_error >= 0.0:
+                break
+            low, low_error = high, high_error
+            high += 2.0
+            high_error, x = rho_error(np.exp(high), x)
+        if low_error > 0.0 or high_error < 0.0:
+            # Ran out of room for rho, so x(rho) is as close to the solution as it gets
+            return x
+
+        # Close in on the root with regula falsi, halving the error of an end that stays put twice in
+        # a row so it doesn't stall (Illinois). The inner solves stop at `tol`, which limits how well
+        # the root can be pinned down to about its square root.
+        stale_side = 0
+        for _ in range(100):
+            if high_error == low_error:
+                break
+            log_rho = high - high_error * (high - low) / (high_error - low_error)
+            error, x = rho_error(np.exp(log_rho), x)
+            self._rho = np.exp(log_rho)
+            if abs(error) <= self.tol ** 0.5 or high - low <= 1e-12:
+                break
+            if error > 0.0:
+                high, high_error = log_rho, error
+                if stale_side == 1:
+                    low_error /= 2.0
+                stale_side = 1
+            else:
+                low, low_error = log_rho, error
+                if stale_side == -1:
+                    high_error /= 2.0
+                stale_side = -1
+
+        return x
+
+    def solve(self, covariance_returns, index_weights):
+        """
+        Find the optimal weights.
+
+        Parameters
+        ----------
+        covariance_returns : 2 dimensional Ndarray or LowRankCovariance
+            The covariance of the returns
+        index_weights : Pandas Series
+            Index weights for all tickers at a period in time
+
+        Returns
+        -------
+        x : 1 dimensional Ndarray
+            The solution for x
+        """
+        if not isinstance(covariance_returns, LowRankCovariance):
+            covariance_returns = np.asarray(covariance_returns, dtype=np.float64)
+        index_weights = np.asarray(index_weights, dtype=np.float64)
+        assert covariance_returns.shape == (len(index_weights), len(index_weights))
+
+        x = self._x
+        if x is None or len(x) != len(index_weights):
+            x = project_to_simplex(index_weights)
+        largest_eigenvalue = _largest_eigenvalue(covariance_returns)
+
+        if self.penalty == 'norm':
+            x = self._solve_norm(covariance_returns, index_weights, largest_eigenvalue, x)
+        else:
+            x = self._solve_squared(covariance_returns, index_weights, 2.0 * self.scale, largest_eigenvalue, x)
+
+        self._x = x
+        return x.copy()
+
+
+def get_optimal_weights(covariance_returns, index_weights, scale=2.0, method='cvxpy', penalty='norm'):
+    """
+    Find the optimal weights.
+
+    Parameters
+    ----------
+    covariance_returns : 2 dimensional Ndarray or LowRankCovariance
+        The covariance of the returns
+    index_weights : Pandas Series
+        Index weights for all tickers at a period in time
+    scale : int
+        The penalty factor for weights the deviate from the index
+    method : str
+        Solve with 'cvxpy', or with the dedicated 'projected_gradient' solver
+    penalty : str
+        How to penalize the distance to the index. Either 'norm' or 'squared_norm'
+
+    Returns
+    -------
+    x : 1 dimensional Ndarray
+        The solution for x
+    """
+    assert len(covariance_returns.shape) == 2
+    assert len(index_weights.shape) == 1
+    assert covariance_returns.shape[0] == covariance_returns.shape[1] == index_weights.shape[0]
+    assert method in METHODS, 'Unknown method {}'.format(method)
+
+    if method == 'projected_gradient':
+        return ProjectedGradientOptimizer(scale, penalty).solve(covariance_returns, index_weights)
+
+    if isinstance(covariance_returns, LowRankCovariance):
+        optimizer = IndexTrackingOptimizer(
+            len(index_weights), covariance_returns.n_factors, scale, penalty=penalty, idiosyncratic=True)
+        return optimizer.solve_low_rank(covariance_returns, index_weights)
+
+    optimizer = IndexTrackingOptimizer(len(index_weights), scale=scale, penalty=penalty)
+    return optimizer.solve(covariance_returns, index_weights)
+
+
+def rebalance_portfolio(
+        returns,
+        index_weights,
+        shift_size,
+        chunk_size,
+        scale=2.0,
+        solver=None,
+        method='cvxpy',
+        penalty='norm',
+        covariance_estimator=None):
+    """
+    Get weights for each rebalancing of the portfolio.
+
+    Same as the project's `rebalance_portfolio`, but with one optimizer for all the rebalances and the
+    covariance of each window from a `RollingCovariance` that slides along the returns. The 'cvxpy'
+    method solves with an `IndexTrackingOptimizer` and the 'projected_gradient' method with a
+    `ProjectedGradientOptimizer`. With `covariance_estimator`, each window's covariance
+    comes from it instead and is passed to the optimizer as it is, dense or `LowRankCovariance`.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    index_weights : DataFrame
+        Index weight for each ticker and date
+    shift_size : int
+        The number of days between each rebalance
+    chunk_size : int
+        The number of days to look in the past for rebalancing
+    scale : float
+        The penalty factor for weights the deviate from the index
+    solver : str
+        The cvxpy solver to use. Uses the cvxpy default if None
+    method : str
+        Solve with 'cvxpy', or with the dedicated 'projected_gradient' solver
+    penalty : str
+        How to penalize the distance to the index. Either 'norm' or 'squared_norm'
+    covariance_estimator : function
+        Takes the returns of a window and gives their covariance, like `covariance.ledoit_wolf_covariance`
+        or `covariance.factor_covariance`. Uses the sample covariance if None
+
+    Returns
+    -------
+    all_rebalance_weights  : list of Ndarrays
+        The ETF weights for each point they are rebalanced
+    """
+    assert returns.index.equals(index_weights.index)
+    assert returns.columns.equals(index_weights.columns)
+    assert shift_size > 0
+    assert chunk_size > 1
+    assert method in METHODS, 'Unknown method {}'.format(method)
+
+    if covariance_estimator is not None:
+        return _rebalance_with_estimator(
+            returns, index_weights, shift_size, chunk_size, scale, solver, method, penalty, covariance_estimator)
+
+    if method == 'projected_gradient':
+        optimizer = ProjectedGradientOptimizer(scale, penalty)
+    else:
+        optimizer = IndexTrackingOptimizer(len(returns.columns), scale=scale, solver=solver, penalty=penalty)
+
+    return [
+        optimizer.solve(covariance_returns, index_weights.iloc[day])
+        for day, covariance_returns in rolling_covariances(returns, shift_size, chunk_size)]
+
+
+def _rebalance_with_estimator(
+        returns, index_weights, shift_size, chunk_size, scale, solver, method, penalty, covariance_estimator):
+    projected_gradient_optimizer = ProjectedGradientOptimizer(scale, penalty)
+    # Built on the first rebalance, once the number of factors of the estimates is known
+    cvxpy_optimizer = None
+    all_rebalance_weights = []
+
+    for day in range(chunk_size - 1, len(returns.index) - 1, shift_size):
+        covariance_returns = covariance_estimator(returns.iloc[day - (chunk_size - 1):day + 1])
+        day_index_weights = index_weights.iloc[day]
+
+        if method == 'projected_gradient':
+            weights = projected_gradient_optimizer.solve(covariance_returns, day_index_weights)
+        elif isinstance(covariance_returns, LowRankCovariance):
+            if cvxpy_optimizer is None or cvxpy_optimizer.n_factors != covariance_returns.n_factors:
+                cvxpy_optimizer = IndexTrackingOptimizer(
+                    len(returns.columns), covariance_returns.n_factors, scale, solver, penalty, idiosyncratic=True)
+            weights = cvxpy_optimizer.solve_low_rank(covariance_returns, day_index_weights)
+        else:
+            if cvxpy_optimizer is None or cvxpy_optimizer.n_factors is not None:
+                cvxpy_optimizer = IndexTrackingOptimizer(
+                    len(returns.columns), scale=scale, solver=solver, penalty=penalty)
+            weights = cvxpy_optimizer.solve(covariance_returns, day_index_weights)
+        all_rebalance_weights.append(weights)
+
+    return all_rebalance_weights
+
+
+def _rebalance_job(job):
+    returns, index_weights, shift_size, chunk_size, scale, solver, method, penalty, covariance_estimator = job
+    return rebalance_portfolio(
+        returns, index_weights, shift_size, chunk_size, scale, solver, method, penalty, covariance_estimator)
+
+
+def parallel_rebalance_portfolio(
+        returns,
+        index_weights,
+        shift_size,
+        chunk_size,
+        scale=2.0,
+        solver=None,
+        method='cvxpy',
+        penalty='norm',
+        covariance_estimator=None,
+        n_workers=None,
+        rebalances_per_job=10,
+        progress=True):
+    """
+    Get weights for each rebalancing of the portfolio, spreading the rebalances over a process pool.
+
+    The rebalances are split into jobs of `rebalances_per_job` consecutive dates. Each job gets the
+    returns its windows cover and runs `rebalance_portfolio` on them, so a worker builds one optimizer
+    and one rolling covariance per job and sends back only the weights. The results are the same as
+    `rebalance_portfolio`, in the same order.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    index_weights : DataFrame
+        Index weight for each ticker and date
+    shift_size : int
+        The number of days between each rebalance
+    chunk_size : int
+        The number of days to look in the past for rebalancing
+    scale : float
+        The penalty factor for weights the deviate from the index
+    solver : str
+        The cvxpy solver to use. Uses the cvxpy default if None
+    method : str
+        Solve with 'cvxpy', or with the dedicated 'projected_gradient' solver
+    penalty : str
+        How to penalize the distance to the index. Either 'norm' or 'squared_norm'
+    covariance_estimator : function
+        Takes the returns of a window and gives their covariance. Uses the sample covariance if None. Must
+        be picklable, like a module level function or a `functools.partial` of one
+    n_workers : int
+        Number of worker processes. Runs in this process if 1. Defaults to the number of CPUs
+    rebalances_per_job : int
+        Number of consecutive rebalances to send to a worker at a time
+    progress : bool
+        Show a progress bar of the rebalances solved
+
+    Returns
+    -------
+    all_rebalance_weights  : list of Ndarrays
+        The ETF weights for each point they are rebalanced
+    """
+    assert returns.index.equals(index_weights.index)
+    assert returns.columns.equals(index_weights.columns)
+    assert shift_size > 0
+    assert chunk_size > 1
+    assert rebalances_per_job > 0
+
+    rebalance_days = list(range(chunk_size - 1, len(returns.index) - 1, shift_size))
+    jobs = []
+    for start in range(0, len(rebalance_days), rebalances_per_job):
+        job_days = rebalance_days[start:start + rebalances_per_job]
+        # From the start of the first window to one past the last rebalance, which `rebalance_portfolio`
+        # needs to see to include it
+        rows = slice(job_days[0] - (chunk_size - 1), job_days[-1] + 2)
+        jobs.append((
+            (
+                returns.iloc[rows], index_weights.iloc[rows], shift_size, chunk_size, scale, solver, method,
+                penalty, covariance_estimator),
+            len(job_days)))
+
+    job_weights = [None] * len(jobs)
+    with tqdm(total=len(rebalance_days), desc='Rebalancing', unit='Rebalance', disable=not progress) as pbar:
+        if n_workers == 1:
+            for i, (job, n_rebalances) in enumerate(jobs):
+                job_weights[i] = _rebalance_job(job)
+                pbar.update(n_rebalances)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as executor:
+                futures = {executor.submit(_rebalance_job, job): i for i, (job, _) in enumerate(jobs)}
+                for future in as_completed(futures):
+                    i = futures[future]
+                    job_weights[i] = future.result()
+                    pbar.update(jobs[i][1])
+
+    return list(itertools.chain.from_iterable(job_weights))
@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+
+def _factorize_cells(df, index, columns):
+    """
+    Get the row and column position of each row of a long format DataFrame in the wide format.
+    """
+    row_codes, row_labels = pd.factorize(df[index], sort=True)
+    column_codes, column_labels = pd.factorize(df[columns], sort=True)
+    row_labels = pd.Index(row_labels, name=index)
+    column_labels = pd.Index(column_labels, name=columns)
+
+    assert (row_codes >= 0).all() and (column_codes >= 0).all(), 'Missing values in the index or columns'
+
+    cell_counts = np.bincount(
+        row_codes * len(column_labels) + column_codes,
+        minlength=len(row_labels) * len(column_labels))
+    if (cell_counts > 1).any():
+        raise ValueError('Index contains duplicate entries, cannot reshape')
+
+    return row_codes, column_codes, row_labels, column_labels
+
+
+def pivot_fields(df, fields, index='date', columns='ticker'):
+    """
+    Pivot several columns of a long format DataFrame into wide format in one pass.
+
+    Same as calling `df.reset_index().pivot(index=index, columns=columns, values=field)` for
+    each field, but the index and columns are only sorted and factorized once.
+
+    Parameters
+    ----------
+    df : DataFrame
+        Long format data, with one row for each index and column pair
+    fields : list of str
+        The columns of `df` to pivot
+    index : str
+        The column of `df` to use as the index of the wide DataFrames
+    columns : str
+        The column of `df` to use as the columns of the wide DataFrames
+
+    Returns
+    -------
+    field_dfs : dict of DataFrame
+        Wide DataFrame for each field. All DataFrames share the same index objects
+    """
+    row_codes, column_codes, row_labels, column_labels = _factorize_cells(df, index, columns)
+    shape = (len(row_labels), len(column_labels))
+    is_complete = len(df) == shape[0] * shape[1]
+
+    field_dfs = {}
+    for field in fields:
+        values = df[field].values
+        dtype = values.dtype
+        if not is_complete and dtype.kind in 'iub':
+            # Missing cells are filled with NaN, same as pivot
+            dtype = np.float64
+
+        wide_values = np.empty(shape, dtype=dtype)
+        if not is_complete:
+            wide_values.fill(np.nan)
+        wide_values[row_codes, column_codes] = values
+        field_dfs[field] = pd.DataFrame(wide_values, row_labels, column_labels, copy=False)
+
+    return field_dfs
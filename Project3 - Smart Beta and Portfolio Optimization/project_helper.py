@@ -1,5 +1,7 @@
 import helper
 import numpy as np
+import pandas as pd
+from universe import top_percent_mask, trailing_sums
 from IPython.core.display import display, HTML
 import plotly.graph_objs as go
 import plotly.figure_factory as ff
@@ -8,30 +10,79 @@ import plotly.offline as offline_py
 offline_py.init_notebook_mode(connected=True)
 
 
-def _generate_hover_text(x_text, y_text, z_values, x_label, y_label, z_label):
-    float_to_str = np.vectorize('{:.7f}'.format)
+# Smallest size in pixels of a heatmap cell that can still be told apart and hovered over
+HEATMAP_CELL_PIXELS = 2
+# Size in pixels of the correlation plot, and the fraction of each axis taken by its heatmap
+CORRELATION_PLOT_SIZE = 800
+CORRELATION_HEATMAP_DOMAIN = .85
+# The weights and returns plots fill the browser window, about this many pixels across
+WINDOW_PLOT_SIZE = 1000
+# Most cells to draw along each axis of a heatmap. Larger matrices are averaged down to fit the plot.
+MAX_HEATMAP_CELLS_PER_AXIS = WINDOW_PLOT_SIZE // HEATMAP_CELL_PIXELS
+MAX_CORRELATION_CELLS_PER_AXIS = int(CORRELATION_PLOT_SIZE * CORRELATION_HEATMAP_DOMAIN) // HEATMAP_CELL_PIXELS
 
-    x_hover_text_values = np.tile(x_text, (len(y_text), 1))
-    y_hover_text_values = np.tile(y_text, (len(x_text), 1))
 
-    padding_len = np.full(3, max(len(x_label), len(y_label), len(z_label))) - \
-                  [len(x_label), len(y_label), len(z_label)]
+def _block_starts(n, max_blocks):
+    """
+    Get the start of each block when splitting `n` rows into at most `max_blocks` equal blocks.
+    """
+    if max_blocks is None:
+        return np.arange(n)
+    return np.arange(0, n, max(-(-n // max_blocks), 1))
 
-    # Additional padding added to ticker and date to align
-    hover_text = x_label + ':  ' + padding_len[0] * ' ' + x_hover_text_values + '<br>' + \
-                 y_label + ':  ' + padding_len[1] * ' ' + y_hover_text_values.T + '<br>' + \
-                 z_label + ': ' + padding_len[2] * ' ' + float_to_str(z_values)
 
-    return hover_text
+def _block_means(values, row_starts, column_starts):
+    """
+    Average the values in each block of rows and columns, skipping NaNs.
+    """
+    is_value = ~np.isnan(values)
+    sums = np.add.reduceat(np.add.reduceat(np.where(is_value, values, 0.0), row_starts, axis=0), column_starts, axis=1)
+    counts = np.add.reduceat(np.add.reduceat(is_value.astype(np.int64), row_starts, axis=0), column_starts, axis=1)
 
+    with np.errstate(invalid='ignore'):
+        return sums / counts
 
-def _generate_heatmap_trace(df, x_label, y_label, z_label, scale_min, scale_max):
-    hover_text = _generate_hover_text(df.index, df.columns, df.values.T, x_label, y_label, z_label)
 
-    return go.Heatmap(
-        x=df.index,
-        y=df.columns,
-        z=df.values.T,
+def _block_labels(labels, starts):
+    """
+    Label each block with its first and last label.
+    """
+    ends = np.append(starts[1:], len(labels)) - 1
+
+    return [
+        str(labels[start]) if start == end else '{} - {}'.format(labels[start], labels[end])
+        for start, end in zip(starts, ends)]
+
+
+def _generate_hover_text(x_text, y_text, z_values, x_label, y_label, z_label):
+    padding_len = np.full(3, max(len(x_label), len(y_label), len(z_label))) - \
+                  [len(x_label), len(y_label), len(z_label)]
+
+    # Format the ticker and date parts once, then each cell is a single string format
+    # Additional padding added to ticker and date to align
+    x_hover_text = ['{}:  {}{}<br>'.format(x_label, padding_len[0] * ' ', x) for x in x_text]
+    y_hover_text = [
+        '{}:  {}{}<br>{}: {}'.format(y_label, padding_len[1] * ' ', y, z_label, padding_len[2] * ' ') for y in y_text]
+
+    return [
+        ['{}{}{:.7f}'.format(x, y, z) for x, z in zip(x_hover_text, z_row)]
+        for y, z_row in zip(y_hover_text, z_values.tolist())]
+
+
+def _generate_heatmap_trace(df, x_label, y_label, z_label, scale_min, scale_max, max_size, webgl):
+    x_starts = _block_starts(len(df.index), max_size)
+    y_starts = _block_starts(len(df.columns), max_size)
+    z_values = df.values.T
+    if len(x_starts) < len(df.index) or len(y_starts) < len(df.columns):
+        z_values = _block_means(z_values, y_starts, x_starts)
+    hover_text = _generate_hover_text(
+        _block_labels(df.index, x_starts), _block_labels(df.columns, y_starts), z_values, x_label, y_label, z_label)
+
+    heatmap = go.Heatmapgl if webgl else go.Heatmap
+    return heatmap(
+        x=df.index[x_starts],
+        y=df.columns[y_starts],
+        z=z_values,
         zauto=False,
         zmax=scale_max,
         zmin=scale_min,
@@ -44,7 +95,25 @@ def _sanatize_string(string):
     return ''.join([i for i in string if i.isalpha()])
 
 
-def large_dollar_volume_stocks(df, price_column, volume_column, top_percent):
+def _dollar_volume_matrix(df, price_column, volume_column):
+    """
+    Get the dollar volume of each ticker and date as a date by ticker matrix, with 0 for missing rows.
+    Also marks each ticker and date with a price with 1.
+    """
+    date_codes, dates = pd.factorize(df['date'], sort=True)
+    ticker_codes, tickers = pd.factorize(df['ticker'], sort=True)
+
+    prices = np.asarray(df[price_column].values, dtype=np.float64)
+    dollar_volume = df[volume_column].values * prices
+    dollar_volume_matrix = np.zeros((len(dates), len(tickers)))
+    dollar_volume_matrix[date_codes, ticker_codes] = np.where(np.isnan(dollar_volume), 0.0, dollar_volume)
+    has_price_matrix = np.zeros((len(dates), len(tickers)), dtype=np.int64)
+    has_price_matrix[date_codes, ticker_codes] = ~np.isnan(prices)
+
+    return dollar_volume_matrix, has_price_matrix, pd.Index(dates), pd.Index(tickers)
+
+
+def large_dollar_volume_stocks(df, price_column, volume_column, top_percent, window=None, dates=None):
     """
     Get the stocks with the largest dollar volume stocks.
 
@@ -58,15 +127,43 @@ def large_dollar_volume_stocks(df, price_column, volume_column, top_percent):
         The column with the volume in `df`
     top_percent : float
         The top x percent to consider largest in the stock universe
+    window : int
+        Number of trading days of dollar volume to rank on, up to each date in `dates`.
+        Ranks on all of `df` at once if None
+    dates : list
+        The rebalance dates to screen on when `window` is set. Defaults to every date in `df`
 
     Returns
     -------
     large_dollar_volume_stocks_symbols : List of str
-        List of of large dollar volume stock symbols
+        List of of large dollar volume stock symbols. A dict of these lists by date if `window` is set
     """
-    dollar_traded = df.groupby('ticker').apply(lambda row: sum(row[volume_column] * row[price_column]))
+    if window is None:
+        ticker_codes, tickers = pd.factorize(df['ticker'], sort=True)
+        dollar_volume = df[volume_column].values * df[price_column].values
+        dollar_traded = pd.Series(
+            np.bincount(ticker_codes, weights=np.where(np.isnan(dollar_volume), 0.0, dollar_volume)),
+            tickers)
+
+        return dollar_traded.sort_values().tail(int(len(dollar_traded) * top_percent)).index.values.tolist()
+
+    dollar_volume_matrix, has_price_matrix, all_dates, tickers = _dollar_volume_matrix(df, price_column, volume_column)
+    date_positions = np.arange(len(all_dates)) if dates is None else all_dates.get_indexer(dates)
+    assert (date_positions >= 0).all(), 'Rebalance dates must be dates in `df`'
 
-    return dollar_traded.sort_values().tail(int(len(dollar_traded) * top_percent)).index.values.tolist()
+    # Same selection as `universe.dollar_volume_universe`. Only tickers with a price in the window are eligible.
+    trailing_dollar_volume = trailing_sums(dollar_volume_matrix, window)[date_positions]
+    n_eligible = (trailing_sums(has_price_matrix, window)[date_positions] > 0).sum(axis=1)
+    top_masks = top_percent_mask(trailing_dollar_volume, n_eligible, top_percent)
+
+    large_dollar_volume_stocks_symbols = {}
+    for date_position, dollar_traded, top_mask in zip(date_positions, trailing_dollar_volume, top_masks):
+        # Smallest dollar volume first, like the ranking on all of `df`
+        top_ids = np.flatnonzero(top_mask)
+        top_ids = top_ids[np.argsort(dollar_traded[top_ids], kind='mergesort')]
+        large_dollar_volume_stocks_symbols[all_dates[date_position]] = tickers[top_ids].tolist()
+
+    return large_dollar_volume_stocks_symbols
 
 
 def plot_benchmark_returns(benchmark_data, etf_data, title):
@@ -120,10 +217,11 @@ def print_dataframe(df, n_rows=10, n_columns=3):
     offline_py.iplot([trace], config=config)
 
 
-def plot_weights(weights, title):
+def plot_weights(weights, title, max_size=MAX_HEATMAP_CELLS_PER_AXIS, webgl=False):
     config = helper.generate_config()
     graph_path = 'graphs/{}.html'.format(_sanatize_string(title))
-    trace = _generate_heatmap_trace(weights.sort_index(axis=1, ascending=False), 'Date', 'Ticker', 'Weight', 0.0, 0.2)
+    trace = _generate_heatmap_trace(
+        weights.sort_index(axis=1, ascending=False), 'Date', 'Ticker', 'Weight', 0.0, 0.2, max_size, webgl)
     layout = go.Layout(
         title=title,
         xaxis={'title': 'Dates'},
@@ -135,10 +233,11 @@ def plot_weights(weights, title):
                  .format(title, graph_path)))
 
 
-def plot_returns(returns, title):
+def plot_returns(returns, title, max_size=MAX_HEATMAP_CELLS_PER_AXIS, webgl=False):
     config = helper.generate_config()
     graph_path = 'graphs/{}.html'.format(_sanatize_string(title))
-    trace = _generate_heatmap_trace(returns.sort_index(axis=1, ascending=False), 'Date', 'Ticker', 'Weight', -0.3, 0.3)
+    trace = _generate_heatmap_trace(
+        returns.sort_index(axis=1, ascending=False), 'Date', 'Ticker', 'Weight', -0.3, 0.3, max_size, webgl)
     layout = go.Layout(
         title=title,
         xaxis={'title': 'Dates'},
@@ -150,7 +249,7 @@ def plot_returns(returns, title):
                  .format(title, graph_path)))
 
 
-def plot_covariance_returns_correlation(correlation, title):
+def plot_covariance_returns_correlation(correlation, title, max_size=MAX_CORRELATION_CELLS_PER_AXIS, webgl=False):
     config = helper.generate_config()
     graph_path = 'graphs/{}.html'.format(_sanatize_string(title))
     data = []
@@ -165,17 +264,29 @@ def plot_covariance_returns_correlation(correlation, title):
         dendro_left['data'][i]['xaxis'] = 'x2'
     data.extend(dendro_left['data'])
 
+    x_starts = _block_starts(len(correlation.columns), max_size)
+    y_starts = _block_starts(len(correlation.index), max_size)
+    # Each cell sits at the mean position of the dendrogram leaves it covers
+    x_positions = np.asarray(dendro_top['layout']['xaxis']['tickvals'], dtype=np.float64)
+    y_positions = np.asarray(dendro_left['layout']['yaxis']['tickvals'], dtype=np.float64)
+    z_values = correlation.values
+    if len(x_starts) < len(correlation.columns) or len(y_starts) < len(correlation.index):
+        x_positions = np.add.reduceat(x_positions, x_starts) / np.diff(np.append(x_starts, len(x_positions)))
+        y_positions = np.add.reduceat(y_positions, y_starts) / np.diff(np.append(y_starts, len(y_positions)))
+        z_values = _block_means(z_values, y_starts, x_starts)
+
     heatmap_hover_text = _generate_hover_text(
-        correlation.index,
-        correlation.columns,
-        correlation.values,
+        _block_labels(correlation.columns, x_starts),
+        _block_labels(correlation.index, y_starts),
+        z_values,
         'Ticker 2',
         'Ticker 1',
         'Correlation')
-    heatmap_trace = go.Heatmap(
-        x=dendro_top['layout']['xaxis']['tickvals'],
-        y=dendro_left['layout']['yaxis']['tickvals'],
-        z=correlation.values,
+    heatmap = go.Heatmapgl if webgl else go.Heatmap
+    heatmap_trace = heatmap(
+        x=x_positions,
+        y=y_positions,
+        z=z_values,
         zauto=False,
         zmax=1.0,
         zmin=-1.0,
@@ -197,13 +308,13 @@ def plot_covariance_returns_correlation(correlation, title):
     layout = go.Layout(
         title=title,
         showlegend=False,
-        width=800,
-        height=800)
+        width=CORRELATION_PLOT_SIZE,
+        height=CORRELATION_PLOT_SIZE)
 
     figure = go.Figure(data=data, layout=layout)
-    figure['layout']['xaxis'].update({'domain': [.15, 1]})
+    figure['layout']['xaxis'].update({'domain': [1 - CORRELATION_HEATMAP_DOMAIN, 1]})
     figure['layout']['xaxis'].update(xaxis1_layout)
-    figure['layout']['yaxis'].update({'domain': [0, .85]})
+    figure['layout']['yaxis'].update({'domain': [0, CORRELATION_HEATMAP_DOMAIN]})
     figure['layout']['yaxis'].update(xaxis1_layout)
 
     figure['layout']['xaxis2'].update({'domain': [0, .15]})
@@ -271,3 +271,359 @@ def test_tracking_error(fn):
             16.5262431971)])
 
     assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_large_dollar_volume_stocks(fn):
+    fn_inputs = {
+        'df': pd.DataFrame({
+            'date': [
+                '2017-01-03', '2017-01-03', '2017-01-03', '2017-01-03', '2017-01-03',
+                '2017-01-04', '2017-01-04', '2017-01-04', '2017-01-04',
+                '2017-01-05', '2017-01-05', '2017-01-05', '2017-01-05', '2017-01-05'],
+            'ticker': [
+                'AAA', 'BBB', 'CCC', 'DDD', 'EEE',
+                'AAA', 'BBB', 'CCC', 'EEE',
+                'AAA', 'BBB', 'CCC', 'DDD', 'EEE'],
+            'adj_close': [
+                10.0, 20.0, 30.0, 40.0, 50.0,
+                11.0, 21.0, 31.0, 51.0,
+                12.0, 22.0, 32.0, 42.0, 52.0],
+            'adj_volume': [
+                900.0, 10.0, 100.0, 300.0, 10.0,
+                10.0, 400.0, 100.0, 10.0,
+                10.0, 10.0, 100.0, 10.0, 500.0]}),
+        'price_column': 'adj_close',
+        'volume_column': 'adj_volume',
+        'top_percent': 0.4,
+        'window': 2,
+        'dates': ['2017-01-03', '2017-01-05']}
+    fn_correct_outputs = OrderedDict([
+        (
+            'large_dollar_volume_stocks_symbols',
+            {
+                '2017-01-03': ['AAA', 'DDD'],
+                '2017-01-05': ['BBB', 'EEE']})])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+    # Tickers without a price in the window aren't counted as eligible
+    fn_inputs = {
+        'df': pd.DataFrame({
+            'date': ['2017-01-03', '2017-01-03', '2017-01-03', '2017-01-03', '2017-01-03'],
+            'ticker': ['AAA', 'BBB', 'CCC', 'DDD', 'EEE'],
+            'adj_close': [10.0, 20.0, 30.0, 40.0, np.nan],
+            'adj_volume': [900.0, 10.0, 100.0, 300.0, 10.0]}),
+        'price_column': 'adj_close',
+        'volume_column': 'adj_volume',
+        'top_percent': 0.4,
+        'window': 1}
+    fn_correct_outputs = OrderedDict([
+        (
+            'large_dollar_volume_stocks_symbols',
+            {'2017-01-03': ['DDD']})])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_dollar_volume_universe(fn):
+    tickers = generate_random_tickers(4)
+    dates = generate_random_dates(5)
+
+    fn_inputs = {
+        'close': pd.DataFrame(
+            [
+                [10.0, 20.0, 30.0, np.nan],
+                [11.0, 21.0, 31.0, np.nan],
+                [12.0, 22.0, 32.0, 42.0],
+                [13.0, 23.0, 33.0, 43.0],
+                [14.0, 24.0, 34.0, 44.0]],
+            dates, tickers),
+        'volume': pd.DataFrame(
+            [
+                [900.0, 10.0, 100.0, np.nan],
+                [900.0, 10.0, 100.0, np.nan],
+                [10.0, 10.0, 100.0, 900.0],
+                [10.0, 500.0, 100.0, 900.0],
+                [10.0, 500.0, 100.0, 900.0]],
+            dates, tickers),
+        'top_percent': 0.5,
+        'window': 2,
+        'rebalance_dates': [dates[1], dates[3]]}
+    fn_correct_outputs = OrderedDict([
+        (
+            'universe',
+            pd.DataFrame(
+                [
+                    [False, False, False, False],
+                    [True, False, False, False],
+                    [True, False, False, False],
+                    [False, True, False, True],
+                    [False, True, False, True]],
+                dates, tickers))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_calculate_dividend_yield_weights(fn):
+    tickers = generate_random_tickers(3)
+    dates = generate_random_dates(4)
+
+    fn_inputs = {
+        'dividends': pd.DataFrame(
+            [
+                [0.0, 0.0, 0.0],
+                [0.0, 0.0, 0.1],
+                [0.0, 1.0, 0.3],
+                [0.0, 0.2, 0.0]],
+            dates, tickers),
+        'window': 2,
+        'close': pd.DataFrame(
+            [
+                [10.0, 10.0, 10.0],
+                [10.0, 10.0, 20.0],
+                [10.0, 20.0, 20.0],
+                [10.0, 20.0, 10.0]],
+            dates, tickers)}
+    fn_correct_outputs = OrderedDict([
+        (
+            'dividend_weights',
+            pd.DataFrame(
+                [
+                    [np.nan, np.nan, np.nan],
+                    [0.00000000, 0.00000000, 1.00000000],
+                    [0.00000000, 0.71428571, 0.28571429],
+                    [0.00000000, 0.66666667, 0.33333333]],
+                dates, tickers))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_rolling_covariances(fn):
+    tickers = generate_random_tickers(3)
+    dates = generate_random_dates(9)
+    returns = pd.DataFrame(
+        [
+            [np.nan, np.nan, np.nan],
+            [0.0207, -0.0112, 0.0051],
+            [-0.0034, 0.0189, np.nan],
+            [0.0113, 0.0041, -0.0217],
+            [-0.0198, -0.0076, 0.0132],
+            [0.0062, 0.0155, 0.0008],
+            [np.nan, -0.0121, 0.0094],
+            [0.0141, 0.0033, -0.0069],
+            [-0.0087, 0.0102, 0.0176]],
+        dates, tickers)
+    shift_size = 2
+    chunk_size = 4
+
+    covariances = list(fn(returns, shift_size, chunk_size))
+    expected_days = list(range(chunk_size - 1, len(dates) - 1, shift_size))
+
+    assert [day for day, _ in covariances] == expected_days, \
+        'Wrong rebalance days. Expected {}, got {}'.format(expected_days, [day for day, _ in covariances])
+    for day, returns_covariance in covariances:
+        expected_covariance = np.cov(returns.iloc[day - (chunk_size - 1):day + 1].T.fillna(0))
+        assert np.allclose(returns_covariance, expected_covariance), 'Wrong covariance for day {}'.format(day)
+
+
+@project_test
+def test_index_tracking_optimizer(cls):
+    covariance_returns = np.array(
+        [
+            [0.143123, 0.0216755, 0.014273],
+            [0.0216755, 0.0401826, 0.00663152],
+            [0.014273, 0.00663152, 0.044963]])
+    index_weights = [
+        pd.Series([0.23623892, 0.0125628, 0.7511982], ['A', 'B', 'C']),
+        pd.Series([0.6, 0.3, 0.1], ['A', 'B', 'C'])]
+    expected_xs = {
+        2.0: [np.array([0.23623897, 0.01256285, 0.75119817]), np.array([0.6, 0.3, 0.1])],
+        0.05: [np.array([0.23215099, 0.01857405, 0.74927496]), np.array([0.27593600, 0.42390439, 0.30015960])]}
+
+    for scale, scale_expected_xs in expected_xs.items():
+        optimizer = cls(3, scale=scale)
+
+        # Re-solving with new parameters should give the same answer as solving a new problem
+        for i in [0, 1, 0, 1]:
+            x = optimizer.solve(covariance_returns, index_weights[i])
+
+            assert x.shape == (3,), 'Wrong shape for x. Expected (3,), got {}'.format(x.shape)
+            assert np.allclose(x, scale_expected_xs[i], atol=1e-4), \
+                'Wrong x for scale {} and index weights {}. Expected {}, got {}'.format(
+                    scale, index_weights[i].values, scale_expected_xs[i], x)
+
+
+@project_test
+def test_get_optimal_weights_methods(fn):
+    random_state = np.random.RandomState(0)
+    returns = random_state.normal(0.0005, 0.02, (250, 20)) + random_state.normal(0.0, 0.01, (250, 1))
+    covariance_returns = np.cov(returns.T)
+    dirichlet_weights = pd.Series(random_state.dirichlet(np.full(20, 0.5)))
+    # An index masked to a universe holds none of the other tickers. Inverse variance weights make the
+    # index close to optimal on its own tickers, so only the tickers it doesn't hold can improve on it.
+    masked_weights = pd.Series(np.where(np.arange(20) % 2 == 0, 1.0 / np.diag(covariance_returns), 0.0))
+    masked_weights /= masked_weights.sum()
+
+    for index_weights in [dirichlet_weights, masked_weights]:
+        for penalty in ['norm', 'squared_norm']:
+            for scale in [2.0, 0.01, 0.0001]:
+                def objective(x):
+                    distance_to_index = x - index_weights.values
+                    if penalty == 'norm':
+                        return x.dot(covariance_returns).dot(x) + scale * np.linalg.norm(distance_to_index)
+                    return x.dot(covariance_returns).dot(x) + scale * np.sum(distance_to_index ** 2)
+
+                cvxpy_x = fn(covariance_returns, index_weights, scale, method='cvxpy', penalty=penalty)
+                fast_x = fn(covariance_returns, index_weights, scale, method='projected_gradient', penalty=penalty)
+
+                assert np.all(fast_x >= 0) and np.isclose(fast_x.sum(), 1.0), \
+                    'Weights are not long only and fully invested for penalty {} and scale {}'.format(penalty, scale)
+                assert np.allclose(fast_x, cvxpy_x, atol=1e-4), \
+                    'Wrong x for penalty {} and scale {}. Expected {}, got {}'.format(penalty, scale, cvxpy_x, fast_x)
+                assert objective(fast_x) <= objective(cvxpy_x) + 1e-8, \
+                    'Objective worse than cvxpy for penalty {} and scale {}'.format(penalty, scale)
+
+
+@project_test
+def test_parallel_rebalance_portfolio(fn):
+    random_state = np.random.RandomState(0)
+    tickers = generate_random_tickers(4)
+    dates = generate_random_dates(30)
+    returns = pd.DataFrame(random_state.normal(0.0005, 0.02, (30, 4)), dates, tickers)
+    index_weights = pd.DataFrame(random_state.dirichlet(np.ones(4), 30), dates, tickers)
+    shift_size = 3
+    chunk_size = 10
+
+    # Each job starts its own rolling covariance and solver, so the jobs only agree to the solvers' accuracy
+    for method in ['cvxpy', 'projected_gradient']:
+        # All the rebalances in one job, in this process
+        expected_weights = fn(
+            returns, index_weights, shift_size, chunk_size, scale=0.0001, method=method, n_workers=1,
+            rebalances_per_job=100, progress=False)
+        all_rebalance_weights = fn(
+            returns, index_weights, shift_size, chunk_size, scale=0.0001, method=method, n_workers=2,
+            rebalances_per_job=2, progress=False)
+
+        assert len(all_rebalance_weights) == len(range(chunk_size - 1, len(dates) - 1, shift_size)), \
+            'Wrong number of rebalances. Got {}'.format(len(all_rebalance_weights))
+        assert len(all_rebalance_weights) == len(expected_weights), \
+            'Wrong number of rebalances. Expected {}, got {}'.format(len(expected_weights), len(all_rebalance_weights))
+        for i, (weights, expected) in enumerate(zip(all_rebalance_weights, expected_weights)):
+            assert np.allclose(weights, expected, atol=1e-4), \
+                'Wrong weights for rebalance {} with {}. Expected {}, got {}'.format(i, method, expected, weights)
+
+
+@project_test
+def test_turnover_costs(fn):
+    rebalance_weights = [
+        [0.00012205033508460705, 0.0003019915743383353, 0.999575958090577],
+        [1.305709815242165e-05, 8.112998801084706e-06, 0.9999788299030465],
+        [0.3917481750142896, 0.5607687848565064, 0.0474830401292039]]
+    fn_inputs = {
+        'all_rebalance_weights': np.array([rebalance_weights, [rebalance_weights[0]] * 3]),
+        'shift_size': 3,
+        'rebalance_count': 2,
+        'linear_cost': 0.001,
+        'quadratic_cost': 0.5}
+    fn_correct_outputs = OrderedDict([
+        ('portfolio_turnover', np.array([80.0434875733, 0.0])),
+        ('linear_cost', np.array([0.0800434876, 0.0])),
+        ('quadratic_cost', np.array([28.8783058998, 0.0]))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_tracking_errors(fn):
+    dates = generate_random_dates(4)
+    variants = ['variant_a', 'variant_b']
+
+    fn_inputs = {
+        'benchmark_returns_by_date': pd.Series(
+                [np.nan, 0.99880148, 0.99876653, 1.00024411],
+                dates),
+        'variant_returns_by_date': pd.DataFrame(
+            [
+                [np.nan, 0.63859274, 0.93475823, 2.57295727],
+                [np.nan, 0.99880148, 0.99876653, 1.00024411]],
+            variants, dates)}
+    fn_correct_outputs = OrderedDict([
+        (
+            'tracking_errors',
+            pd.Series([16.5262431971, 0.0], variants))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_cumulative_returns(fn):
+    dates = generate_random_dates(4)
+    variants = ['variant_a', 'variant_b']
+
+    fn_inputs = {
+        'returns_by_date': pd.DataFrame(
+            [
+                [np.nan, 0.5, -0.2, 0.1],
+                [np.nan, 0.1, np.nan, 0.2]],
+            variants, dates)}
+    fn_correct_outputs = OrderedDict([
+        (
+            'cumulative_returns',
+            pd.DataFrame(
+                [
+                    [np.nan, 1.5, 1.2, 1.32],
+                    [np.nan, 1.1, np.nan, 1.32]],
+                variants, dates))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_ledoit_wolf_covariance(fn):
+    tickers = generate_random_tickers(3)
+    dates = generate_random_dates(4)
+
+    fn_inputs = {
+        'returns': pd.DataFrame(
+            [
+                [np.nan, np.nan, np.nan],
+                [1.59904743, 1.66397210, 1.67345829],
+                [-0.37065629, -0.36541822, -0.36015840],
+                [-0.41055669, 0.60004777, 0.00536958]],
+            dates, tickers)}
+    fn_correct_outputs = OrderedDict([(
+        'returns_covariance',
+        np.array(
+            [
+                [0.8688543123, 0.3602431769, 0.4228936485],
+                [0.3602431769, 0.8131160057, 0.3822135667],
+                [0.4228936485, 0.3822135667, 0.8354911565]]))])
+
+    assert_output(fn, fn_inputs, fn_correct_outputs)
+
+
+@project_test
+def test_factor_covariance(fn):
+    random_state = np.random.RandomState(0)
+    tickers = generate_random_tickers(6)
+    dates = generate_random_dates(20)
+    returns = pd.DataFrame(random_state.normal(0.0, 0.02, (20, 6)), dates, tickers)
+    sample_covariance = np.cov(returns.T)
+
+    returns_covariance = fn(returns, n_factors=6)
+    assert returns_covariance.shape == (6, 6), 'Wrong shape. Got {}'.format(returns_covariance.shape)
+    assert np.allclose(returns_covariance.dense(), sample_covariance), \
+        'With every factor, the covariance should be the sample covariance'
+
+    returns_covariance = fn(returns, n_factors=2)
+    dense_covariance = returns_covariance.dense()
+    weights = random_state.dirichlet(np.ones(6))
+    assert returns_covariance.n_factors == 2, 'Wrong number of factors. Got {}'.format(returns_covariance.n_factors)
+    assert np.allclose(np.diag(dense_covariance), np.diag(sample_covariance)), \
+        'The variance of each ticker should be its sample variance'
+    assert np.allclose(returns_covariance.dot(weights), np.dot(dense_covariance, weights)), \
+        'dot should match the dense covariance'
@@ -0,0 +1,90 @@
+import numpy as np
+
+
+def turnover_costs(
+        all_rebalance_weights,
+        shift_size,
+        rebalance_count=None,
+        n_trading_days_in_year=252,
+        linear_cost=0.0,
+        quadratic_cost=0.0):
+    """
+    Calculate the annualized portfolio turnover and transaction costs of rebalance schedules.
+
+    Works on one schedule, with the weights stacked into a (rebalance, ticker) array, or a batch of
+    schedules in a (schedule, rebalance, ticker) array. The trades are taken with one `np.diff` along
+    the rebalances, and the turnover and both costs are summed from them in the same pass. NaN weights
+    don't trade, the same as `get_portfolio_turnover`.
+
+    Parameters
+    ----------
+    all_rebalance_weights : list of Ndarrays, 2 dimensional Ndarray or 3 dimensional Ndarray
+        The ETF weights for each point they are rebalanced, for one or many schedules
+    shift_size : int
+        The number of days between each rebalance
+    rebalance_count : int
+        Number of times the portfolio was rebalanced. Defaults to the number of weights minus one
+    n_trading_days_in_year: int
+        Number of trading days in a year
+    linear_cost : float
+        Cost of trading, as a fraction of the amount traded
+    quadratic_cost : float
+        Cost of trading, as a fraction of the square of the amount traded, for market impact
+
+    Returns
+    -------
+    portfolio_turnover
+        The portfolio turnover
+    linear_cost
+        The linear transaction cost per year, as a fraction of the portfolio
+    quadratic_cost
+        The quadratic transaction cost per year, as a fraction of the portfolio
+
+    All three are floats for one schedule, or 1 dimensional Ndarrays with a value for each schedule
+    for a batch
+    """
+    assert shift_size > 0
+
+    weights = np.asarray(all_rebalance_weights, dtype=np.float64)
+    assert weights.ndim in (2, 3), 'Weights must be (rebalance, ticker) or (schedule, rebalance, ticker)'
+    if rebalance_count is None:
+        rebalance_count = weights.shape[-2] - 1
+    assert rebalance_count > 0
+
+    trades = np.diff(weights, axis=-2)
+    trades[np.isnan(trades)] = 0.0
+
+    squared_traded = np.einsum('...ij,...ij->...', trades, trades)
+    traded = np.abs(trades, out=trades).sum(axis=(-2, -1))
+
+    number_of_rebal_events_per_year = n_trading_days_in_year / shift_size
+    annualize = number_of_rebal_events_per_year / rebalance_count
+
+    portfolio_turnover = traded * annualize
+
+    return portfolio_turnover, linear_cost * portfolio_turnover, quadratic_cost * squared_traded * annualize
+
+
+def get_portfolio_turnover(all_rebalance_weights, shift_size, rebalance_count, n_trading_days_in_year=252):
+    """
+    Calculate portfolio turnover.
+
+    Parameters
+    ----------
+    all_rebalance_weights : list of Ndarrays, 2 dimensional Ndarray or 3 dimensional Ndarray
+        The ETF weights for each point they are rebalanced, for one or many schedules
+    shift_size : int
+        The number of days between each rebalance
+    rebalance_count : int
+        Number of times the portfolio was rebalanced
+    n_trading_days_in_year: int
+        Number of trading days in a year
+
+    Returns
+    -------
+    portfolio_turnover  : float or 1 dimensional Ndarray
+        The portfolio turnover, for each schedule in a batch
+    """
+    portfolio_turnover, _, _ = turnover_costs(all_rebalance_weights, shift_size, rebalance_count, n_trading_days_in_year)
+
+    return portfolio_turnover
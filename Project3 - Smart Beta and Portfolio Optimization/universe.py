@@ -0,0 +1,115 @@
+import numpy as np
+import pandas as pd
+
+
+def trailing_sums(values, window):
+    """
+    Sum of the last `window` rows up to and including each row, from the difference of two cumulative sums.
+
+    Parameters
+    ----------
+    values : 2 dimensional Ndarray
+        Values for each date (rows) and ticker (columns)
+    window : int
+        Number of rows to sum over
+
+    Returns
+    -------
+    trailing_sums : 2 dimensional Ndarray
+        The trailing sum for each date and ticker
+    """
+    cumulative_sums = np.zeros((values.shape[0] + 1,) + values.shape[1:], dtype=values.dtype)
+    np.cumsum(values, axis=0, out=cumulative_sums[1:])
+    window_starts = np.maximum(np.arange(values.shape[0]) + 1 - window, 0)
+
+    # Reuse the cumulative sum buffer for the result
+    trailing = cumulative_sums[1:]
+    trailing -= cumulative_sums[window_starts]
+
+    return trailing
+
+
+def top_percent_mask(scores, n_eligible, top_percent):
+    """
+    Select the `int(n_eligible * top_percent)` largest scores of each row.
+
+    Ties keep the ticker that sorts first in the row, the same as a stable ascending sort.
+
+    Parameters
+    ----------
+    scores : 2 dimensional Ndarray
+        Score for each date (rows) and ticker (columns)
+    n_eligible : 1 dimensional Ndarray
+        Number of tickers that can be selected on each date
+    top_percent : float
+        The top x percent to select
+
+    Returns
+    -------
+    mask : 2 dimensional Ndarray
+        True for the selected tickers
+    """
+    n_rows, n_columns = scores.shape
+    n_top = (np.asarray(n_eligible) * top_percent).astype(np.int64)
+
+    # Rank of each ticker in its row, in ascending order
+    order = np.argsort(scores, axis=1, kind='mergesort')
+    ranks = np.empty((n_rows, n_columns), dtype=np.int64)
+    ranks[np.arange(n_rows)[:, None], order] = np.arange(n_columns)
+
+    return ranks >= (n_columns - n_top)[:, None]
+
+
+def dollar_volume_universe(close, volume, top_percent, window, rebalance_dates=None):
+    """
+    Get the point-in-time universe of large dollar volume stocks.
+
+    On each rebalance date, the stocks are ranked on their dollar volume over the trailing `window`
+    trading days, up to and including that date. Only tickers with a close price in the window can be
+    selected. Membership is held until the next rebalance date. The trailing sums come from the
+    difference of two cumulative sums, so each date costs O(tickers) no matter the window.
+
+    Parameters
+    ----------
+    close : DataFrame
+        Close price for each ticker and date
+    volume : DataFrame
+        Volume for each ticker and date
+    top_percent : float
+        The top x percent to consider largest in the stock universe
+    window : int
+        Number of trading days of dollar volume to rank on
+    rebalance_dates : list
+        The dates to reselect the universe on. Defaults to every date in `close`
+
+    Returns
+    -------
+    universe : DataFrame
+        True for each ticker and date in the universe. Has the same index and columns as `close`
+    """
+    assert close.index.equals(volume.index)
+    assert close.columns.equals(volume.columns)
+    assert window > 0
+
+    close_values = np.asarray(close.values, dtype=np.float64)
+    dollar_volume = close_values * volume.values
+    dollar_volume[np.isnan(dollar_volume)] = 0.0
+    has_close = (~np.isnan(close_values)).astype(np.int64)
+
+    if rebalance_dates is None:
+        rebalance_positions = np.arange(len(close.index))
+    else:
+        rebalance_positions = close.index.get_indexer(rebalance_dates)
+        assert (rebalance_positions >= 0).all(), 'Rebalance dates must be dates in `close`'
+        rebalance_positions = np.unique(rebalance_positions)
+
+    trailing_dollar_volume = trailing_sums(dollar_volume, window)[rebalance_positions]
+    n_eligible = (trailing_sums(has_close, window)[rebalance_positions] > 0).sum(axis=1)
+    rebalance_masks = top_percent_mask(trailing_dollar_volume, n_eligible, top_percent)
+
+    # Hold each rebalance's selection until the next one. Dates before the first rebalance are empty.
+    rebalance_ids = np.searchsorted(rebalance_positions, np.arange(len(close.index)), side='right') - 1
+    universe_values = rebalance_masks[np.maximum(rebalance_ids, 0)]
+    universe_values[rebalance_ids < 0] = False
+
+    return pd.DataFrame(universe_values, close.index, close.columns, copy=False)
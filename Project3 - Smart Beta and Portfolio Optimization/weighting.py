@@ -0,0 +1,135 @@
+import numpy as np
+import pandas as pd
+
+from universe import trailing_sums
+
+
+# Number of rows to sum at a time, so skipping NaNs only needs a small temporary buffer
+ROW_BLOCK_SIZE = 256
+
+
+def normalize_rows(values, zero_total_fill=np.nan):
+    """
+    Divide each row by its sum, in place.
+
+    NaNs are left out of the row sums and stay NaN, the same as `df.div(df.sum(axis=1), axis=0)`.
+
+    Parameters
+    ----------
+    values : 2 dimensional Ndarray
+        Float values for each date (rows) and ticker (columns). Overwritten with the weights
+    zero_total_fill : float
+        The weight to give every ticker on dates where the values sum to zero
+
+    Returns
+    -------
+    values : 2 dimensional Ndarray
+        The same array, holding the weights
+    """
+    totals = np.empty(len(values))
+    for start in range(0, len(values), ROW_BLOCK_SIZE):
+        totals[start:start + ROW_BLOCK_SIZE] = np.nansum(values[start:start + ROW_BLOCK_SIZE], axis=1)
+
+    has_total = totals != 0
+    np.divide(values, totals[:, None], out=values, where=has_total[:, None])
+    values[~has_total] = zero_total_fill
+
+    return values
+
+
+def _restore_nans(values, source_values):
+    if source_values.dtype.kind == 'f':
+        is_nan = np.isnan(source_values)
+        if is_nan.any():
+            values[is_nan] = np.nan
+
+
+def generate_dollar_volume_weights(close, volume, universe=None, out=None):
+    """
+    Generate dollar volume weights.
+
+    The dollar volume is multiplied straight into one float64 buffer, which is then normalized in
+    place, so no intermediate DataFrames are made.
+
+    Parameters
+    ----------
+    close : DataFrame
+        Close price for each ticker and date
+    volume : DataFrame
+        Volume for each ticker and date
+    universe : DataFrame
+        True for each ticker and date that can be held, like the mask from
+        `universe.dollar_volume_universe`. Holds every ticker if None
+    out : 2 dimensional Ndarray
+        Float64 buffer with the shape of `close` to write the weights into. Allocated if None
+
+    Returns
+    -------
+    dollar_volume_weights : DataFrame
+        The dollar volume weights for each ticker and date
+    """
+    assert close.index.equals(volume.index)
+    assert close.columns.equals(volume.columns)
+
+    if out is None:
+        out = np.empty(close.shape, dtype=np.float64)
+    assert out.shape == close.shape and out.dtype == np.float64
+
+    np.multiply(close.values, volume.values, out=out)
+    if universe is not None:
+        assert universe.index.equals(close.index)
+        assert universe.columns.equals(close.columns)
+        out[~universe.values] = 0.0
+
+    return pd.DataFrame(normalize_rows(out), close.index, close.columns, copy=False)
+
+
+def calculate_dividend_weights(dividends, window=None, close=None, universe=None):
+    """
+    Calculate dividend weights.
+
+    Each ticker is weighted by its cumulative dividends up to each date. With `window`, only the
+    dividends in the trailing `window` trading days count, which gives a dividend yield weighting
+    when `close` is also passed.
+
+    Parameters
+    ----------
+    dividends : DataFrame
+        Dividend for each stock and date
+    window : int
+        Number of trading days of dividends to weight on. Uses all the dividends up to each date if None
+    close : DataFrame
+        Close price for each stock and date. Divides the trailing dividends by the close to get the
+        trailing dividend yield. Only used with `window`
+    universe : DataFrame
+        True for each stock and date that can be held, like the mask from
+        `universe.dollar_volume_universe`. Holds every stock if None
+
+    Returns
+    -------
+    dividend_weights : DataFrame
+        Weights for each stock and date
+    """
+    dividend_values = dividends.values
+    weights = np.array(dividend_values, dtype=np.float64)
+    weights[np.isnan(weights)] = 0.0
+
+    if window is None:
+        np.cumsum(weights, axis=0, out=weights)
+    else:
+        # Add the newest date and drop the oldest one from a running sum, instead of summing each window
+        weights = trailing_sums(weights, window)
+        if close is not None:
+            assert close.index.equals(dividends.index)
+            assert close.columns.equals(dividends.columns)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.divide(weights, close.values, out=weights)
+            weights[~np.isfinite(weights)] = np.nan
+
+    _restore_nans(weights, dividend_values)
+    if universe is not None:
+        assert universe.index.equals(dividends.index)
+        assert universe.columns.equals(dividends.columns)
+        weights[~universe.values] = 0.0
+
+    return pd.DataFrame(normalize_rows(weights), dividends.index, dividends.columns, copy=False)
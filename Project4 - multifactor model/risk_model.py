@@ -0,0 +1,156 @@
+import cvxpy as cvx
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import PCA
+
+
+def idiosyncratic_var_vector(returns, factor_returns, factor_betas, ann_factor):
+    """
+    Get the idiosyncratic variance vector straight from the returns.
+
+    Same as `idiosyncratic_var_vector(returns, idiosyncratic_var_matrix(...))`, without building the
+    N x N idiosyncratic variance matrix, which is zero off the diagonal.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    factor_returns : DataFrame
+        Factor returns
+    factor_betas : DataFrame
+        Factor betas
+    ann_factor : int
+        Annualization factor
+
+    Returns
+    -------
+    idiosyncratic_var_vector : DataFrame
+        Idiosyncratic variance Vector
+    """
+    assert factor_betas.index.equals(returns.columns)
+
+    spec_returns = np.array(returns.values, dtype=np.float64)
+    spec_returns -= np.dot(factor_returns.values, factor_betas.values.T)
+
+    # NaN returns are skipped, the same as the DataFrame variance
+    idiosyncratic_var_vector = pd.DataFrame(np.nanvar(spec_returns, axis=0) * ann_factor, index=returns.columns)
+    return idiosyncratic_var_vector
+
+
+def get_risk(weights, factor_betas, alpha_vector_index, factor_cov_matrix, idiosyncratic_var_vector):
+    """
+    Get the predicted variance of the portfolio returns for CVXPY
+
+    Drop-in replacement for `AbstractOptimalHoldings._get_risk`. The idiosyncratic variance enters as
+    sum_squares(sqrt(S) * x) instead of a quad_form with an N x N diagonal matrix, so the problem stays
+    O(N) in the number of tickers.
+
+    Parameters
+    ----------
+    weights : CVXPY Variable
+        Portfolio weights
+    factor_betas : DataFrame
+        Factor betas
+    alpha_vector_index : Pandas Index
+        The tickers in the portfolio, in the order of `weights`
+    factor_cov_matrix : 2 dimensional Ndarray
+        Factor covariance matrix
+    idiosyncratic_var_vector : DataFrame
+        Idiosyncratic variance Vector
+
+    Returns
+    -------
+    risk : CVXPY Atom
+        Predicted variance of the portfolio returns
+    """
+    f = factor_betas.loc[alpha_vector_index].values.T * weights
+    idiosyncratic_std = np.sqrt(idiosyncratic_var_vector.loc[alpha_vector_index].values.flatten())
+
+    return cvx.quad_form(f, factor_cov_matrix) + cvx.sum_squares(cvx.multiply(idiosyncratic_std, weights))
+
+
+def predict_portfolio_risk(factor_betas, factor_cov_matrix, idiosyncratic_var_matrix, weights):
+    """
+    Get the predicted portfolio risk of one or many portfolios
+
+    Same formula, sqrt(X.T(BFB.T + S)X), as the project's `predict_portfolio_risk`, computed as
+    sqrt(||F^(1/2) B.T X||^2 + sum(S * X^2)) so BFB.T is never built. That's O(N * K) per portfolio
+    instead of O(N^2 * K). Each column of `weights` is a portfolio, so a batch is scored with one
+    matrix multiply.
+
+    Parameters
+    ----------
+    factor_betas : DataFrame
+        Factor betas
+    factor_cov_matrix : 2 dimensional Ndarray
+        Factor covariance matrix
+    idiosyncratic_var_matrix : DataFrame
+        Idiosyncratic variance matrix, or the idiosyncratic variance vector
+    weights : DataFrame
+        Portfolio weights, with a column for each portfolio
+
+    Returns
+    -------
+    predicted_portfolio_risk : float or Pandas Series
+        Predicted portfolio risk. A Series with the risk of each column of `weights` when there is more
+        than one
+    """
+    assert len(factor_cov_matrix.shape) == 2
+
+    idiosyncratic_var_values = np.asarray(idiosyncratic_var_matrix, dtype=np.float64)
+    if idiosyncratic_var_values.ndim == 2 and idiosyncratic_var_values.shape[1] > 1:
+        # Only the diagonal of the matrix is used
+        idiosyncratic_var_values = np.diagonal(idiosyncratic_var_values)
+    idiosyncratic_var_values = idiosyncratic_var_values.reshape(-1)
+
+    weight_values = np.asarray(weights, dtype=np.float64)
+    weight_values = weight_values.reshape(len(weight_values), -1)
+    assert len(weight_values) == len(factor_betas) == len(idiosyncratic_var_values)
+
+    factor_exposures = np.dot(np.asarray(factor_betas, dtype=np.float64).T, weight_values)
+    factor_variance = np.einsum('kp,kp->p', factor_exposures, np.dot(factor_cov_matrix, factor_exposures))
+    idiosyncratic_variance = np.dot(idiosyncratic_var_values, weight_values ** 2)
+    predicted_portfolio_risk = np.sqrt(factor_variance + idiosyncratic_variance)
+
+    if weight_values.shape[1] == 1:
+        return predicted_portfolio_risk[0]
+    if isinstance(weights, pd.DataFrame):
+        return pd.Series(predicted_portfolio_risk, weights.columns)
+    return predicted_portfolio_risk
+
+
+def build_risk_model(returns, num_factor_exposures=20, svd_solver='full', ann_factor=252):
+    """
+    Build the statistical risk model from the returns
+
+    Fits the PCA model and gets the factor betas, factor returns, factor covariance matrix and
+    idiosyncratic variance vector, the same way as the project. The idiosyncratic variance is only
+    kept as a vector.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    num_factor_exposures : int
+        Number of factors for PCA
+    svd_solver: str
+        The solver to use for the PCA model
+    ann_factor : int
+        Annualization factor
+
+    Returns
+    -------
+    risk_model : dict
+        The 'factor_betas', 'factor_returns', 'factor_cov_matrix' and 'idiosyncratic_var_vector'
+    """
+    pca = PCA(n_components=num_factor_exposures, svd_solver=svd_solver).fit(returns)
+    factors = np.arange(num_factor_exposures)
+
+    risk_model = {}
+    risk_model['factor_betas'] = pd.DataFrame(pca.components_.T, returns.columns, factors)
+    risk_model['factor_returns'] = pd.DataFrame(pca.transform(returns), returns.index, factors)
+    risk_model['factor_cov_matrix'] = np.diag(risk_model['factor_returns'].var(axis=0, ddof=1) * ann_factor)
+    risk_model['idiosyncratic_var_vector'] = idiosyncratic_var_vector(
+        returns, risk_model['factor_returns'], risk_model['factor_betas'], ann_factor)
+
+    return risk_model
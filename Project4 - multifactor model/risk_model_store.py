@@ -0,0 +1,232 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from risk_model import build_risk_model
+
+
+STORE_VERSION = 1
+META_FILE = 'meta.json'
+DATES_FILE = 'dates.npy'
+TICKERS_FILE = 'tickers.npy'
+FACTORS_FILE = 'factors.npy'
+# The arrays of the risk model, and the indexes of their rows and columns
+ARRAYS = {
+    'factor_betas': (TICKERS_FILE, FACTORS_FILE),
+    'factor_returns': (DATES_FILE, FACTORS_FILE),
+    'factor_cov_matrix': (None, None),
+    'idiosyncratic_var_vector': (TICKERS_FILE, None)}
+
+
+def _array_file(store_dir, name):
+    return os.path.join(store_dir, '{}.npy'.format(name))
+
+
+def _index_values(index):
+    if isinstance(index, pd.DatetimeIndex):
+        # Saved in UTC, with the time zone in the metadata
+        if index.tz is not None:
+            index = index.tz_convert(None)
+        return np.asarray(index, dtype='datetime64[ns]')
+    if all(isinstance(label, str) for label in index):
+        return np.asarray(index, dtype=str)
+    # Labels like zipline Equity objects are pickled
+    return np.asarray(index, dtype=object)
+
+
+def _save_index(path, index):
+    np.save(path, _index_values(index), allow_pickle=True)
+
+
+def _load_index(path, name, tz=None):
+    values = np.load(path, allow_pickle=True)
+    if values.dtype.kind == 'M':
+        index = pd.DatetimeIndex(values, name=name)
+        return index if tz is None else index.tz_localize('UTC').tz_convert(tz)
+
+    return pd.Index(values.astype(object), name=name)
+
+
+def returns_hash(returns, **params):
+    """
+    Get a hash of the content of the returns and the parameters used to build a risk model from them.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    params : dict
+        Parameters of the risk model, like `num_factor_exposures`
+
+    Returns
+    -------
+    returns_hash : str
+        The sha256 hex digest
+    """
+    sha256 = hashlib.sha256()
+    sha256.update(json.dumps(params, sort_keys=True).encode())
+    sha256.update(str(returns.shape).encode())
+    sha256.update(np.ascontiguousarray(returns.values, dtype=np.float64).tobytes())
+
+    for index in (returns.index, returns.columns):
+        index_values = _index_values(index)
+        if index_values.dtype.kind == 'O':
+            sha256.update('\n'.join(str(label) for label in index_values).encode())
+        else:
+            sha256.update(np.ascontiguousarray(index_values).tobytes())
+
+    return sha256.hexdigest()
+
+
+def save_risk_model(risk_model, store_dir, source_hash=None):
+    """
+    Save a risk model to a risk model store.
+
+    Each array is saved in its own `.npy` file, next to the ticker, date and factor index files. The
+    metadata is written last, so a store that was interrupted while saving is never loaded.
+
+    Parameters
+    ----------
+    risk_model : dict
+        The 'factor_betas', 'factor_returns', 'factor_cov_matrix' and 'idiosyncratic_var_vector'
+    store_dir : str
+        Directory to save the risk model store to
+    source_hash : str
+        The `returns_hash` of the returns the risk model was built from
+    """
+    factor_betas = risk_model['factor_betas']
+    factor_returns = risk_model['factor_returns']
+    assert factor_betas.columns.equals(factor_returns.columns)
+    assert risk_model['idiosyncratic_var_vector'].index.equals(factor_betas.index)
+
+    if not os.path.isdir(store_dir):
+        os.makedirs(store_dir)
+    meta_path = os.path.join(store_dir, META_FILE)
+    if os.path.isfile(meta_path):
+        os.remove(meta_path)
+
+    _save_index(os.path.join(store_dir, TICKERS_FILE), factor_betas.index)
+    _save_index(os.path.join(store_dir, DATES_FILE), factor_returns.index)
+    _save_index(os.path.join(store_dir, FACTORS_FILE), factor_betas.columns)
+    for name in ARRAYS:
+        np.save(_array_file(store_dir, name), np.asarray(risk_model[name], dtype=np.float64))
+
+    dates_tz = getattr(factor_returns.index, 'tz', None)
+    index_names = {
+        TICKERS_FILE: factor_betas.index.name,
+        DATES_FILE: factor_returns.index.name,
+        FACTORS_FILE: factor_betas.columns.name}
+    with open(meta_path, 'w') as f:
+        json.dump({
+            'version': STORE_VERSION,
+            'source_hash': source_hash,
+            'dates_tz': None if dates_tz is None else str(dates_tz),
+            'index_names': {
+                index_file: name if isinstance(name, str) else None for index_file, name in index_names.items()},
+            'shape': [len(factor_returns.index), len(factor_betas.index), len(factor_betas.columns)]}, f)
+
+
+def _read_meta(store_dir):
+    meta_path = os.path.join(store_dir, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path) as f:
+        return json.load(f)
+
+
+def load_risk_model(store_dir):
+    """
+    Load a risk model from a risk model store.
+
+    The arrays are memory-mapped, so loading doesn't read or copy the data. They are read-only.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the risk model store
+
+    Returns
+    -------
+    risk_model : dict
+        The 'factor_betas', 'factor_returns', 'factor_cov_matrix' and 'idiosyncratic_var_vector'
+    """
+    meta = _read_meta(store_dir)
+    assert meta is not None, 'No risk model store found in {}'.format(store_dir)
+    assert meta['version'] == STORE_VERSION, 'Risk model store version {} is not supported'.format(meta['version'])
+
+    indexes = {
+        index_file: _load_index(
+            os.path.join(store_dir, index_file),
+            meta['index_names'][index_file],
+            meta['dates_tz'] if index_file == DATES_FILE else None)
+        for index_file in (TICKERS_FILE, DATES_FILE, FACTORS_FILE)}
+
+    risk_model = {}
+    for name, (index_file, columns_file) in ARRAYS.items():
+        values = np.load(_array_file(store_dir, name), mmap_mode='r')
+        if index_file is None:
+            risk_model[name] = values
+        else:
+            columns = None if columns_file is None else indexes[columns_file]
+            risk_model[name] = pd.DataFrame(values.reshape(len(values), -1), indexes[index_file], columns, copy=False)
+
+    return risk_model
+
+
+def is_stale(store_dir, source_hash):
+    """
+    Check if a risk model store needs to be rebuilt.
+
+    Parameters
+    ----------
+    store_dir : str
+        Directory of the risk model store
+    source_hash : str
+        The `returns_hash` of the returns the risk model should be built from
+
+    Returns
+    -------
+    stale : bool
+        True if the store is missing, out of date or built from different returns
+    """
+    meta = _read_meta(store_dir)
+
+    return meta is None or \
+        meta['version'] != STORE_VERSION or \
+        meta['source_hash'] != source_hash
+
+
+def load_or_build_risk_model(returns, store_dir, num_factor_exposures=20, svd_solver='full', ann_factor=252):
+    """
+    Load the risk model for the returns, building and saving it only if the store is stale.
+
+    Parameters
+    ----------
+    returns : DataFrame
+        Returns for each ticker and date
+    store_dir : str
+        Directory of the risk model store
+    num_factor_exposures : int
+        Number of factors for PCA
+    svd_solver: str
+        The solver to use for the PCA model
+    ann_factor : int
+        Annualization factor
+
+    Returns
+    -------
+    risk_model : dict
+        The 'factor_betas', 'factor_returns', 'factor_cov_matrix' and 'idiosyncratic_var_vector'
+    """
+    source_hash = returns_hash(
+        returns, num_factor_exposures=num_factor_exposures, svd_solver=svd_solver, ann_factor=ann_factor)
+
+    if is_stale(store_dir, source_hash):
+        risk_model = build_risk_model(returns, num_factor_exposures, svd_solver, ann_factor)
+        save_risk_model(risk_model, store_dir, source_hash)
+
+    return load_risk_model(store_dir)
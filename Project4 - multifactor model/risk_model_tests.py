@@ -0,0 +1,114 @@
+from collections import OrderedDict
+import os
+import tempfile
+import pandas as pd
+import numpy as np
+
+from risk_model import build_risk_model
+from tests import generate_random_tickers, assert_output, project_test
+
+
+class Equity(object):
+    """
+    Stand-in for the zipline Equity objects that the tickers of the project's returns are.
+    """
+    def __init__(self, sid, symbol):
+        self.sid = sid
+        self.symbol = symbol
+
+    def __eq__(self, other):
+        return isinstance(other, Equity) and other.sid == self.sid
+
+    def __hash__(self):
+        return hash(self.sid)
+
+    def __repr__(self):
+        return 'Equity({} [{}])'.format(self.sid, self.symbol)
+
+
+def _assert_risk_model_equal(risk_model, expected_risk_model):
+    assert sorted(risk_model) == sorted(expected_risk_model), 'Wrong risk model keys'
+
+    for name, expected in expected_risk_model.items():
+        out = risk_model[name]
+        if isinstance(expected, pd.DataFrame):
+            assert out.index.equals(expected.index), 'Wrong index for {}'.format(name)
+            assert out.columns.equals(expected.columns), 'Wrong columns for {}'.format(name)
+            assert out.index.name == expected.index.name, 'Wrong index name for {}'.format(name)
+            out = out.values
+            expected = expected.values
+        assert np.allclose(out, expected), 'Wrong values for {}'.format(name)
+
+
+@project_test
+def test_load_or_build_risk_model(fn):
+    rs = np.random.RandomState(0)
+    dates = pd.date_range('2016-01-04', periods=30, freq='B', tz='UTC', name='date')
+    tickers = [Equity(sid, symbol) for sid, symbol in enumerate(generate_random_tickers(6))]
+    returns = pd.DataFrame(rs.normal(0.0, 0.02, (len(dates), len(tickers))), dates, tickers)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store_dir = os.path.join(tmp_dir, 'risk_model')
+        cov_path = os.path.join(store_dir, 'factor_cov_matrix.npy')
+
+        risk_model = fn(returns, store_dir, 2)
+        _assert_risk_model_equal(risk_model, build_risk_model(returns, 2))
+        assert str(risk_model['factor_returns'].index.tz) == 'UTC', \
+            'Wrong time zone. Expected UTC, got {}'.format(risk_model['factor_returns'].index.tz)
+        assert isinstance(risk_model['factor_betas'].index[0], Equity), \
+            'Wrong ticker type. Expected Equity, got {}'.format(type(risk_model['factor_betas'].index[0]))
+
+        # A store that's up to date isn't rebuilt, so the overwritten array is loaded as is
+        np.save(cov_path, np.zeros((2, 2)))
+        risk_model = fn(returns, store_dir, 2)
+        assert np.allclose(risk_model['factor_cov_matrix'], 0.0), 'The store was rebuilt, but it was up to date'
+
+        changed_returns = returns.copy()
+        changed_returns.iloc[3, 4] += 0.01
+        risk_model = fn(changed_returns, store_dir, 2)
+        _assert_risk_model_equal(risk_model, build_risk_model(changed_returns, 2))
+
+        risk_model = fn(changed_returns, store_dir, 3)
+        _assert_risk_model_equal(risk_model, build_risk_model(changed_returns, 3))
+
+
+@project_test
+def test_predict_portfolio_risk(fn):
+    tickers = generate_random_tickers(4)
+    factor_betas = pd.DataFrame(
+        [
+            [-0.04316847, 0.01955111],
+            [-0.00993375, 0.01054038],
+            [-0.01245078, 0.00281858],
+            [-0.02089712, -0.06061045]],
+        tickers, [0, 1])
+    factor_cov_matrix = np.array([
+        [0.00163497, 0.00000000],
+        [0.00000000, 0.00082316]])
+    idiosyncratic_var_vector = pd.DataFrame([0.02272535, 0.03434558, 0.01410011, 0.02965042], tickers)
+    idiosyncratic_var_matrix = pd.DataFrame(np.diag(idiosyncratic_var_vector[0]), tickers, tickers)
+    weights = pd.DataFrame(
+        [
+            [0.25, 0.50, -0.10],
+            [0.25, 0.00, 0.40],
+            [0.25, 0.20, 0.30],
+            [0.25, 0.30, 0.40]],
+        tickers, ['equal', 'long', 'long_short'])
+
+    # sqrt(X.T(BFB.T + S)X) with the dense N x N covariance matrix of the tickers
+    covariance = factor_betas.values.dot(factor_cov_matrix).dot(factor_betas.values.T) + idiosyncratic_var_matrix.values
+    expected_risk = np.sqrt(np.einsum('np,nm,mp->p', weights.values, covariance, weights.values))
+
+    for idiosyncratic_var in (idiosyncratic_var_matrix, idiosyncratic_var_vector):
+        fn_inputs = {
+            'factor_betas': factor_betas,
+            'factor_cov_matrix': factor_cov_matrix,
+            'idiosyncratic_var_matrix': idiosyncratic_var,
+            'weights': weights[['equal']]}
+        fn_correct_outputs = OrderedDict([('predicted_portfolio_risk', expected_risk[0])])
+        assert_output(fn, fn_inputs, fn_correct_outputs)
+
+        fn_inputs['weights'] = weights
+        fn_correct_outputs = OrderedDict([
+            ('predicted_portfolio_risk', pd.Series(expected_risk, weights.columns))])
+        assert_output(fn, fn_inputs, fn_correct_outputs)